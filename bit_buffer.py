@@ -0,0 +1,109 @@
+"""
+Packed bit buffer used by the encode pipeline instead of '0'/'1' strings.
+
+Complete bytes are kept in a bytearray; the (fewer than 8) bits that do not
+fill a byte yet wait in a small integer accumulator. BitReader reads such a
+stream back, most significant bit first.
+"""
+
+
+class BitBuffer:
+    __slots__ = ('_bytes', '_acc', '_acc_bits')
+
+    def __init__(self):
+        self._bytes = bytearray()
+        self._acc = 0
+        self._acc_bits = 0
+
+    @classmethod
+    def from_bytes(cls, data, n_bits):
+        """Builds a buffer holding the first n_bits bits of data."""
+        buffer = cls()
+        full, rest = divmod(n_bits, 8)
+        buffer._bytes += data[:full]
+        if rest:
+            buffer._acc = data[full] >> (8 - rest)
+            buffer._acc_bits = rest
+        return buffer
+
+    def __len__(self):
+        """Number of bits in the buffer."""
+        return 8 * len(self._bytes) + self._acc_bits
+
+    def append_bits(self, value, n):
+        """
+        Appends the n lowest bits of value, most significant bit first.
+
+        Raises:
+            ValueError: if value does not fit in n bits.
+        """
+        if n < 0 or value < 0 or value >> n:
+            raise ValueError(f"Value {value} does not fit in {n} bits.")
+        acc = (self._acc << n) | value
+        acc_bits = self._acc_bits + n
+        if acc_bits >= 8:
+            full = acc_bits // 8
+            acc_bits -= 8 * full
+            self._bytes += (acc >> acc_bits).to_bytes(full, 'big')
+            acc &= (1 << acc_bits) - 1
+        self._acc = acc
+        self._acc_bits = acc_bits
+
+    def append_bytes(self, data):
+        """Appends whole bytes (8 bits each)."""
+        if self._acc_bits:
+            self.append_bits(int.from_bytes(data, 'big'), 8 * len(data))
+        else:
+            self._bytes += data
+
+    def extend(self, other):
+        """Appends all bits of another BitBuffer."""
+        self.append_bytes(other._bytes)
+        self.append_bits(other._acc, other._acc_bits)
+
+    def pad_to_byte(self):
+        """Appends zero bits up to the next byte boundary."""
+        if self._acc_bits:
+            self.append_bits(0, 8 - self._acc_bits)
+
+    def to_bytes(self):
+        """Returns the contents as bytes, padding the last byte with zero bits."""
+        if self._acc_bits:
+            return bytes(self._bytes) + bytes([self._acc << (8 - self._acc_bits)])
+        return bytes(self._bytes)
+
+    def __str__(self):
+        """The contents as a '0'/'1' string (for debugging)."""
+        bits = ''.join(f"{byte:08b}" for byte in self._bytes)
+        if self._acc_bits:
+            bits += f"{self._acc:0{self._acc_bits}b}"
+        return bits
+
+
+class BitReader:
+    __slots__ = ('_data', '_position', '_n_bits')
+
+    def __init__(self, data):
+        self._data = bytes(data)
+        self._position = 0
+        self._n_bits = 8 * len(self._data)
+
+    def remaining(self):
+        """Number of bits not read yet."""
+        return self._n_bits - self._position
+
+    def read_bits(self, n):
+        """
+        Reads the next n bits as an unsigned integer, most significant bit first.
+
+        Raises:
+            ValueError: if fewer than n bits are left.
+        """
+        end = self._position + n
+        if end > self._n_bits:
+            raise ValueError(f"Cannot read {n} bits, only {self.remaining()} left.")
+        # only the bytes that hold the n bits are converted
+        first, last = self._position >> 3, (end + 7) >> 3
+        chunk = int.from_bytes(self._data[first:last], 'big')
+        self._position = end
+        return (chunk >> (8 * last - end)) & ((1 << n) - 1)
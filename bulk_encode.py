@@ -0,0 +1,395 @@
+"""
+Bulk encoding: many payloads at once, spread over a process pool.
+
+Payloads are cut into chunks; inside a chunk they are grouped by (version, ECL) so
+the Reed-Solomon blocks of a whole group are encoded together and the per-version
+templates and placement plans are reused. Every worker process warms those caches
+once, in the pool initializer.
+
+Run as a script it is a streaming command-line encoder:
+
+    python bulk_encode.py urls.txt -o codes.zip
+    python bulk_encode.py --jsonl payloads.jsonl -o out_dir --ecl Q
+    cat urls.txt | python bulk_encode.py -o - > frames.pbm
+
+Payloads are read lazily and at most --max-pending chunks are in flight, so memory
+stays flat however long the input is.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import argparse
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+
+import numpy as np
+
+import main
+import reed_solomon as rs
+import concatenate as ct
+import encoding_plan as ep
+import render
+
+
+def warm_caches(ecls='LMQH'):
+    """Builds the templates, mask planes, placement plans and RS tables of every version."""
+    for version in range(1, 41):
+        main.get_template(version)
+        main.mask_planes(4 * version + 17)
+        for ecl in ecls:
+            main.placement_plan(version, ecl)
+            block_structure = rs.get_block_structure(version, ecl)
+            rs.generator_products(rs.get_ecc(version, ecl) // len(block_structure))
+
+
+def pack_matrix(matrix):
+    """Packs a module matrix to 1 bit per module (rows padded to whole bytes)."""
+    return np.packbits(matrix, axis=1)
+
+
+def unpack_matrix(packed):
+    """Inverse of pack_matrix: the symbol is square, so its size is the number of rows."""
+    return np.unpackbits(packed, axis=1, count=len(packed))
+
+
+def encode_chunk(payloads, ecl='L', boost_ecl=False, skip_errors=False):
+    """
+    Encodes a list of payloads and returns their packed matrices, in input order.
+    With skip_errors=True a payload that cannot be encoded gives None instead of raising.
+    """
+    results = [None] * len(payloads)
+    groups = {}
+    for i, payload in enumerate(payloads):
+        try:
+            plan = ep.plan_encoding(payload, ecl, boost_ecl)
+        except ValueError:
+            if not skip_errors:
+                raise
+            continue
+        groups.setdefault((plan.version, plan.ecl), []).append((i, plan))
+
+    for (version, group_ecl), members in groups.items():
+        data = np.array([np.frombuffer(ct.concatenate(plan)[:plan.capacity], dtype=np.uint8)
+                         for _, plan in members])
+        codewords = rs.rs_encode_symbols(data, version, group_ecl)
+        for (i, _), matrix in zip(members, main.return_mats(version, codewords, group_ecl)):
+            results[i] = pack_matrix(matrix)
+    return results
+
+
+def _chunks(payloads, size):
+    payloads = iter(payloads)
+    while True:
+        chunk = list(islice(payloads, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def encode_stream(payloads, ecl='L', workers=None, chunk_size=256, max_pending=None,
+                  boost_ecl=False, skip_errors=False):
+    """
+    Lazily encodes an iterable of payloads, yielding packed matrices in input order.
+
+    At most max_pending chunks (default: twice the number of workers) are submitted
+    and not yet consumed, so neither the input nor the results pile up in memory.
+    Arguments are as for encode_many.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    chunks = _chunks(payloads, chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from encode_chunk(chunk, ecl, boost_ecl, skip_errors)
+        return
+
+    max_pending = max_pending or 2 * workers
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_caches, initargs=(ecl.upper(),)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(encode_chunk, chunk, ecl, boost_ecl, skip_errors))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def encode_many(payloads, ecl='L', workers=None, chunk_size=256, boost_ecl=False, skip_errors=False):
+    """
+    Encodes many payloads, in parallel when workers > 1.
+
+    Args:
+        payloads: iterable of strings
+        ecl: error correction level for all payloads
+        workers: number of processes (default: all CPUs); 0 or 1 encodes in this process
+        chunk_size: payloads sent to a worker at a time
+        boost_ecl: raise the ECL when the chosen version has room to spare
+        skip_errors: give None for payloads that cannot be encoded instead of raising
+
+    Returns:
+        list of packed matrices (see pack_matrix / unpack_matrix), in input order.
+    """
+    return list(encode_stream(payloads, ecl, workers, chunk_size, None, boost_ecl, skip_errors))
+
+
+# ---------------------------------------------------------------------------
+# Command line: payload sources, image encoding and output sinks
+# ---------------------------------------------------------------------------
+
+def read_lines(stream):
+    """Yields (name, payload) for every line of a text stream, without the line break."""
+    for index, line in enumerate(stream):
+        yield f"{index:08d}", line.rstrip('\r\n')
+
+
+def _is_safe_name(name):
+    """True if name is a plain file name: not empty, absolute, '.' / '..' or containing a separator."""
+    return (bool(name) and name not in ('.', '..') and not os.path.isabs(name)
+            and not any(separator in name for separator in ('/', '\\', '\0')))
+
+
+def read_jsonl(stream, on_error=None):
+    """
+    Yields (name, payload) for every line of a JSONL stream. A line is either a JSON
+    string or an object with a "text" (or "payload") field and an optional "name".
+    Names become file and archive member names, so one that is not a plain file
+    name (see _is_safe_name) is replaced by the line index.
+
+    Args:
+        on_error: called as on_error(name, message) for a line that is neither,
+            which is then skipped
+
+    Raises:
+        ValueError: for such a line, when on_error is not given.
+    """
+    for index, line in enumerate(stream):
+        if not line.strip():
+            continue
+        name = f"{index:08d}"
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            record, message = None, f"line {index + 1}: invalid JSON ({error})"
+        else:
+            message = f"line {index + 1}: expected a string or an object with a \"text\" field"
+        if isinstance(record, dict):
+            given = str(record.get('name', name))
+            if _is_safe_name(given):
+                name = given
+            record = record.get('text', record.get('payload'))
+        if not isinstance(record, str):
+            if on_error is None:
+                raise ValueError(f"{name}: {message}")
+            on_error(name, message)
+            continue
+        yield name, record
+
+
+def pbm_bytes(packed, scale=1, border=4):
+    """A binary PBM (P4) image of a packed matrix."""
+    output = io.BytesIO()
+    render.write_pbm(output, unpack_matrix(packed), scale, border)
+    return output.getvalue()
+
+
+def pgm_bytes(packed, scale=1, border=4):
+    """A binary PGM (P5) image of a packed matrix."""
+    output = io.BytesIO()
+    render.write_pgm(output, unpack_matrix(packed), scale, border)
+    return output.getvalue()
+
+
+def png_bytes(packed, scale=1, border=4):
+    """A 1-bit PNG image of a packed matrix."""
+    output = io.BytesIO()
+    render.write_png(output, unpack_matrix(packed), scale, border)
+    return output.getvalue()
+
+
+def svg_bytes(packed, scale=1, border=4):
+    """An SVG image of a packed matrix."""
+    output = io.BytesIO()
+    render.write_svg(output, unpack_matrix(packed), scale, border)
+    return output.getvalue()
+
+
+IMAGE_WRITERS = {'png': png_bytes, 'pbm': pbm_bytes, 'pgm': pgm_bytes, 'svg': svg_bytes}
+
+
+class DirectorySink:
+    """Writes every image to its own file in a directory."""
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def write(self, name, data):
+        with open(os.path.join(self.path, name), 'wb') as file:
+            file.write(data)
+
+    def close(self):
+        pass
+
+
+class TarSink:
+    """Streams the images into a tar archive (compressed if the name ends in .gz/.tgz/.bz2/.xz)."""
+
+    COMPRESSIONS = {'.gz': 'gz', '.tgz': 'gz', '.bz2': 'bz2', '.xz': 'xz'}
+
+    def __init__(self, path):
+        compression = self.COMPRESSIONS.get(os.path.splitext(path)[1], '')
+        self.archive = tarfile.open(path, 'w|' + compression)
+        self.mtime = time.time()
+
+    def write(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = self.mtime
+        self.archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.archive.close()
+
+
+class ZipSink:
+    """Streams the images into a zip archive (stored: PNG and packed PBM hardly compress)."""
+
+    def __init__(self, path):
+        self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED)
+
+    def write(self, name, data):
+        self.archive.writestr(name, data)
+
+    def close(self):
+        self.archive.close()
+
+
+class FrameSink:
+    """
+    Writes the images back to back to a binary stream (concatenated PBM frames).
+    When the reader goes away (`... -o - | head`) the sink is marked closed
+    instead of raising BrokenPipeError.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.closed = False
+
+    def _reader_gone(self):
+        self.closed = True
+        # the interpreter flushes stdout again at exit; send that to /dev/null
+        try:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), self.stream.fileno())
+        except (OSError, ValueError, io.UnsupportedOperation):
+            pass
+
+    def write(self, name, data):
+        if self.closed:
+            return
+        try:
+            self.stream.write(data)
+        except BrokenPipeError:
+            self._reader_gone()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.stream.flush()
+        except BrokenPipeError:
+            self._reader_gone()
+
+
+def open_sink(output):
+    """Picks the sink for an output argument: '-', *.tar[.gz|.bz2|.xz], *.tgz, *.zip or a directory."""
+    if output == '-':
+        return FrameSink(sys.stdout.buffer)
+    if output.endswith('.zip'):
+        return ZipSink(output)
+    if output.endswith(('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')):
+        return TarSink(output)
+    return DirectorySink(output)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Encode one QR code per input line.")
+    parser.add_argument('input', nargs='?', default='-', help="text file with one payload per line (default: stdin)")
+    parser.add_argument('--jsonl', action='store_true', help="the input is JSONL (strings or {\"text\", \"name\"} objects)")
+    parser.add_argument('-o', '--output', required=True,
+                        help="directory, .tar[.gz|.bz2|.xz], .tgz or .zip archive, or - for PBM frames on stdout")
+    parser.add_argument('--format', choices=sorted(IMAGE_WRITERS), help="image format (default: png, pbm for -o -)")
+    parser.add_argument('--ecl', default='L', choices=list('LMQH'), help="error correction level")
+    parser.add_argument('--boost-ecl', action='store_true', help="raise the ECL when the version has room to spare")
+    parser.add_argument('--scale', type=int, default=1, help="pixels per module")
+    parser.add_argument('--border', type=int, default=4, help="quiet zone in modules")
+    parser.add_argument('--workers', type=int, default=None, help="encoding processes (default: all CPUs)")
+    parser.add_argument('--chunk-size', type=int, default=256, help="payloads per worker task")
+    parser.add_argument('--max-pending', type=int, default=None, help="chunks in flight (default: 2 per worker)")
+    parser.add_argument('--strict', action='store_true', help="stop at the first payload that does not fit")
+    parser.add_argument('--progress', type=int, default=0, metavar='N', help="report progress every N codes")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = _parse_args(argv)
+    image_format = args.format or ('pbm' if args.output == '-' else 'png')
+    write_image = IMAGE_WRITERS[image_format]
+
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8', newline='')
+    done = failed = 0
+
+    def bad_record(name, message):
+        nonlocal failed
+        if args.strict:
+            raise ValueError(f"{name}: {message}")
+        failed += 1
+        print(f"{name}: {message}, skipped", file=sys.stderr)
+
+    records = read_jsonl(source, bad_record) if args.jsonl else read_lines(source)
+    # the names stay in this process; only the payloads travel to the workers
+    names = deque()
+
+    def payloads():
+        for name, payload in records:
+            names.append(name)
+            yield payload
+
+    sink = open_sink(args.output)
+    start = time.perf_counter()
+    try:
+        # errors are always skipped in the workers, so that --strict can name the payload
+        for packed in encode_stream(payloads(), args.ecl, args.workers, args.chunk_size, args.max_pending,
+                                    args.boost_ecl, skip_errors=True):
+            name = names.popleft()
+            if packed is None:
+                if args.strict:
+                    raise ValueError(f"{name}: payload too long")
+                failed += 1
+                print(f"{name}: payload too long, skipped", file=sys.stderr)
+            else:
+                sink.write(f"{name}.{image_format}", write_image(packed, args.scale, args.border))
+                if getattr(sink, 'closed', False):
+                    break  # nobody reads stdout any more
+                done += 1
+            if args.progress and (done + failed) % args.progress == 0:
+                print(f"{done + failed} payloads...", file=sys.stderr)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+    finally:
+        sink.close()
+        if source is not sys.stdin:
+            source.close()
+
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed else 0.0
+    print(f"{done} codes written, {failed} skipped in {elapsed:.2f} s ({rate:.0f} codes/s)", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -1,10 +1,58 @@
+import numpy as np
+import unicode_analyze as ua
+from bit_buffer import BitBuffer
+
+ALPHANUMERIC_CHARSET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+ALPHANUMERIC_VALUES = {char: value for value, char in enumerate(ALPHANUMERIC_CHARSET)}
+# bits used for a group of 1, 2 or 3 digits
+NUMERIC_GROUP_BITS = {1: 4, 2: 7, 3: 10}
+
+MODE_INDICATORS = {'numeric': 0b0001, 'alphanumeric': 0b0010, 'byte': 0b0100, 'kanji': 0b1000}
+# width of the character count field for versions 1-9, 10-26 and 27-40
+CHARACTER_COUNT_BITS = {
+    'numeric': (10, 12, 14),
+    'alphanumeric': (9, 11, 13),
+    'byte': (8, 16, 16),
+    'kanji': (8, 10, 12),
+}
+
+# Kanji mode: a Shift-JIS character (lead, trail) becomes the 13-bit value
+# KANJI_LEAD[lead] + trail, where KANJI_LEAD[lead] = (lead - base) * 0xC0 - 0x40
+# (base 0x81 for 0x8140-0x9FFC, 0xC1 for 0xE040-0xEBBF); -1 marks invalid lead bytes.
+KANJI_LEAD = np.full(256, -1, dtype=np.int32)
+KANJI_LEAD[0x81:0xA0] = (np.arange(0x81, 0xA0) - 0x81) * 0xC0 - 0x40
+KANJI_LEAD[0xE0:0xEC] = (np.arange(0xE0, 0xEC) - 0xC1) * 0xC0 - 0x40
+
+def kanji_values(input_string):
+    """
+    Returns the 13-bit Kanji mode values of input_string as an array, computed on the
+    whole Shift-JIS byte string at once.
+    """
+    try:
+        encoded = input_string.encode('shift_jis')
+    except UnicodeEncodeError:
+        encoded = b''
+    raw = np.frombuffer(encoded, dtype=np.uint8)
+    # every character must have become exactly one (lead, trail) pair
+    if len(raw) != 2 * len(input_string):
+        raise ValueError("Kanji mode can only encode double-byte Shift-JIS characters.")
+    codes = raw.reshape(-1, 2).astype(np.int32)
+    lead, trail = codes[:, 0], codes[:, 1]
+    code = (lead << 8) | trail
+    valid = ((code >= 0x8140) & (code <= 0x9FFC)) | ((code >= 0xE040) & (code <= 0xEBBF))
+    if not valid.all():
+        raise ValueError("Kanji mode can only encode double-byte Shift-JIS characters.")
+    return KANJI_LEAD[lead] + trail
+
+def count_bits(mode, version):
+    return CHARACTER_COUNT_BITS[mode][0 if version <= 9 else 1 if version <= 26 else 2]
+
 def string_to_binary(input_string, mode='byte'):
     binary_list = []
     
     if mode == 'numeric':
-        import re
         # Ensure the string contains only digits
-        if not re.match(r'^\d*$', input_string):
+        if ua.tightest_mode(input_string) != 'numeric':
             raise ValueError("Numeric mode can only encode digits 0-9.")
         
         # Group digits in sets of 3
@@ -25,11 +73,11 @@ def string_to_binary(input_string, mode='byte'):
     elif mode == 'alphanumeric':
         # Define the Alphanumeric character set
         alphanum_charset = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+        input_upper = input_string.upper()
         # Ensure all characters are in the alphanum set
-        if not all(char in alphanum_charset for char in input_string.upper()):
+        if ua.tightest_mode(input_upper) not in ('numeric', 'alphanumeric'):
             raise ValueError("Alphanumeric mode can only encode certain characters.")
-        
-        input_upper = input_string.upper()
+
         # Group characters in pairs
         groups = [input_upper[i:i+2] for i in range(0, len(input_upper), 2)]
         
@@ -43,23 +91,82 @@ def string_to_binary(input_string, mode='byte'):
             binary_list.append(bits)
     
     elif mode == 'byte':
-        for char in input_string:
-            # Convert each character to its ASCII binary representation (8 bits)
-            # For Unicode characters beyond ASCII, you can adjust the bit length
-            byte = format(ord(char), '08b')
-            binary_list.append(byte)
+        for byte in input_string.encode('utf-8'):
+            # Each UTF-8 byte of the string is one 8-bit group
+            binary_list.append(format(byte, '08b'))
+
+    elif mode == 'kanji':
+        # Each double-byte Shift-JIS character is packed into 13 bits
+        for value in kanji_values(input_string):
+            binary_list.append(format(int(value), '013b'))
     
     else:
-        raise ValueError("Unsupported mode. Choose from 'numeric', 'alphanumeric', or 'byte'.")
+        raise ValueError("Unsupported mode. Choose from 'numeric', 'alphanumeric', 'byte' or 'kanji'.")
     
     
     return binary_list
+def append_segment(buffer, input_string, mode='byte'):
+    """
+    Appends the data bits of input_string, encoded in the given mode, to a BitBuffer.
+    The mode indicator and character count are not included.
+    """
+    if mode == 'numeric':
+        if input_string and not (input_string.isascii() and input_string.isdigit()):
+            raise ValueError("Numeric mode can only encode digits 0-9.")
+        for i in range(0, len(input_string), 3):
+            group = input_string[i:i+3]
+            buffer.append_bits(int(group), NUMERIC_GROUP_BITS[len(group)])
+
+    elif mode == 'alphanumeric':
+        input_upper = input_string.upper()
+        try:
+            values = [ALPHANUMERIC_VALUES[char] for char in input_upper]
+        except KeyError:
+            raise ValueError("Alphanumeric mode can only encode certain characters.") from None
+        # Pairs of characters take 11 bits, a trailing single one 6 bits
+        for i in range(0, len(values) - 1, 2):
+            buffer.append_bits(values[i] * 45 + values[i + 1], 11)
+        if len(values) % 2:
+            buffer.append_bits(values[-1], 6)
+
+    elif mode == 'byte':
+        buffer.append_bytes(input_string.encode('utf-8'))
+
+    elif mode == 'kanji':
+        values = kanji_values(input_string)
+        # 13 bits per character: the low 13 bits of each value as big-endian 16-bit words
+        bits = np.unpackbits(values.astype('>u2').view(np.uint8)).reshape(-1, 16)[:, 3:]
+        buffer.extend(BitBuffer.from_bytes(np.packbits(bits).tobytes(), 13 * len(values)))
+
+    else:
+        raise ValueError("Unsupported mode. Choose from 'numeric', 'alphanumeric', 'byte' or 'kanji'.")
+
+def char_count(input_string, mode='byte'):
+    """The value of the character count field: characters, or UTF-8 bytes in byte mode."""
+    if mode == 'byte':
+        return len(input_string.encode('utf-8'))
+    return len(input_string)
+
+def data_bit_length(mode, count):
+    """Number of data bits for count characters (bytes in byte mode), in closed form."""
+    if mode == 'numeric':
+        return 10 * (count // 3) + (0, 4, 7)[count % 3]
+    if mode == 'alphanumeric':
+        return 11 * (count // 2) + 6 * (count % 2)
+    if mode == 'byte':
+        return 8 * count
+    if mode == 'kanji':
+        return 13 * count
+    raise ValueError("Unsupported mode. Choose from 'numeric', 'alphanumeric', 'byte' or 'kanji'.")
+
+def segment_bit_length(mode, count, version):
+    """Bits of a whole segment: mode indicator, character count field and data."""
+    return 4 + count_bits(mode, version) + data_bit_length(mode, count)
+
 def binary_count(input_string, mode='byte'):
-    binary_list = string_to_binary(input_string, mode)
-    count = 0
-    for binary in binary_list:
-        count += len(binary)
-    return count
+    buffer = BitBuffer()
+    append_segment(buffer, input_string, mode)
+    return len(buffer)
 # Example usage:
 if __name__ == "__main__":
     input_str = "HELLO WORLD 123"
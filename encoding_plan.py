@@ -0,0 +1,81 @@
+"""
+EncodingPlan: everything the encoder needs to know about one payload, computed once.
+
+The payload is split once into optimal mode segments and encoded a single time;
+the version, capacity and block layout are derived from that, and every later stage (concatenate, reed_solomon,
+main) takes the plan instead of re-analyzing the text.
+"""
+from dataclasses import dataclass
+
+import unicode_analyze as ua
+import data_segment as ds
+import segmentation as seg
+import version_check as vc
+import reed_solomon as rs
+from bit_buffer import BitBuffer
+
+
+@dataclass(frozen=True)
+class EncodingPlan:
+    text: str
+    ecl: str
+    segments: tuple         # ((mode, text), ...)
+    stream: bytes           # mode indicators, character counts and data of all segments
+    bit_length: int         # number of valid bits in stream
+    version: int
+    capacity: int           # data codewords available in this version / ECL
+    block_structure: tuple  # data codewords of every block
+    ecc_per_block: int
+
+    @property
+    def modes(self):
+        return tuple(mode for mode, _ in self.segments)
+
+
+def plan_encoding(input_text, ecl='L', boost_ecl=False):
+    """
+    Analyzes and encodes input_text once and returns its EncodingPlan.
+
+    With boost_ecl=True the error correction level is raised for free when the
+    chosen version has room to spare.
+
+    Raises:
+        ValueError: if the text cannot be encoded in any supported mode.
+    """
+    # The best segmentation depends on the width of the count fields. No version
+    # below the one that holds the cheapest-mode lower bound can fit, so the search
+    # starts in that version's range and only moves to the next range when the
+    # resulting version falls outside the current one.
+    classes = ua.char_classes(input_text)
+    candidate = vc.smallest_version(seg.minimum_bits(classes), ecl)
+    if candidate is None:
+        raise ValueError("The text does not fit in a QR code with this error correction level.")
+    for first, last in vc.VERSION_RANGES:
+        if last < candidate:
+            continue
+        segments = seg.optimal_segments(input_text, first, classes)
+        counts = [(mode, ds.char_count(part, mode)) for mode, part in segments]
+        version, plan_ecl, capacity = vc.select_version(counts, ecl, boost_ecl)
+        if version is not None and version <= last:
+            break
+    else:
+        raise ValueError("The text does not fit in a QR code with this error correction level.")
+
+    stream = BitBuffer()
+    for (mode, part), (_, count) in zip(segments, counts):
+        stream.append_bits(ds.MODE_INDICATORS[mode], 4)
+        stream.append_bits(count, ds.count_bits(mode, version))
+        ds.append_segment(stream, part, mode)
+
+    block_structure = tuple(rs.get_block_structure(version, plan_ecl))
+    return EncodingPlan(
+        text=input_text,
+        ecl=plan_ecl,
+        segments=tuple(segments),
+        stream=stream.to_bytes(),
+        bit_length=len(stream),
+        version=version,
+        capacity=capacity,
+        block_structure=block_structure,
+        ecc_per_block=rs.get_ecc(version, plan_ecl) // len(block_structure),
+    )
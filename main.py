@@ -3,64 +3,56 @@
 # https://youtu.be/Dap1cnMRjeA?si=IVQT9y2_Vy_b9mxW
 
 from PIL import Image
-import copy
+import threading
 import numpy as np
-
-def timing_patterns(matrice, marime):
-    for i in range(8, marime - 8):
-        if i % 2 == 0:
-            matrice[i][6] = matrice[6][i] = 1
-        else:
-            matrice[i][6] = matrice[6][i] = 0
-
-def draw_finders(matrice, marime):
-    def squares(y, x):
-        for i in range(y, y + 7):  # In for-urile astea desenez patratele negre
-            for j in range(x, x + 7):
-                if (x + 1 <= j <= x + 5) and (i == y + 1 or i == y + 5):
-                    matrice[i][j] = 0
-                elif (y + 1 <= i <= y + 5) and (j == x + 1 or j == x + 5):
-                    matrice[i][j] = 0
-                else:
-                    matrice[i][j] = 1
-        # de aici desenez colturile albe
-        if y == x == 0:
-            for i in range(8):
-                matrice[y + i][x + 7] = matrice[y + 7][x + i] = 0
-        elif y == 0 and x == marime - 7:
-            x -= 1
-            for i in range(8):
-                matrice[y + i][x] = matrice[y + 7][x + i] = 0
-        elif y == marime - 7 and x == 0:
-            y -= 1
-            for i in range(8):
-                matrice[y][x + i] = matrice[y + i][x + 7] = 0
-
-    squares(0, 0), squares(0, marime - 7), squares(marime - 7, 0)
-
-def draw_dummy_format_bits(matrice, marime):
-    # Astea-s placeholders pt bitii despre error correction, cred...
-    # mai intai abordam coltul din stanga sus
-    for i in range(9):
-        if i != 6:
-            matrice[8][i] = matrice[i][8] = 0
-    # ACUM coltul din dreapta
-    for i in range(8):
-        matrice[8][marime - 8 + i] = 0
-    # si coltu din stanga jos
-    for i in range(8):
-        matrice[marime - 8 + i][8] = 0
-        if i == 0:
-            matrice[marime - 8 + i][8] = 1
-
-def am_loc(matrice, y, x):
+import reed_solomon as rs
+
+def new_matrix(marime):
+    # Matricea e un ndarray uint8 cu modulele (0 alb, 1 negru), iar in loc de 8 ca "nesetat"
+    # tinem separat o masca booleana cu modulele functionale (finder, timing, format, ...)
+    matrice = np.zeros((marime, marime), dtype=np.uint8)
+    functie = np.zeros((marime, marime), dtype=bool)
+    return matrice, functie
+
+def timing_patterns(matrice, functie, marime):
+    linie = (np.arange(8, marime - 8) % 2 == 0).astype(np.uint8)
+    matrice[6, 8:marime - 8] = matrice[8:marime - 8, 6] = linie
+    functie[6, 8:marime - 8] = functie[8:marime - 8, 6] = True
+
+FINDER = np.ones((7, 7), dtype=np.uint8)
+FINDER[1:6, 1:6] = 0
+FINDER[2:5, 2:5] = 1
+
+ALIGNMENT = np.ones((5, 5), dtype=np.uint8)
+ALIGNMENT[1:4, 1:4] = 0
+ALIGNMENT[2, 2] = 1
+
+def draw_finders(matrice, functie, marime):
+    # fiecare finder vine cu separatorul alb de jur imprejur (8x8 in total)
+    for y, x in ((0, 0), (0, marime - 8), (marime - 8, 0)):
+        matrice[y:y + 8, x:x + 8] = 0
+        functie[y:y + 8, x:x + 8] = True
+    matrice[0:7, 0:7] = FINDER
+    matrice[0:7, marime - 7:] = FINDER
+    matrice[marime - 7:, 0:7] = FINDER
+
+FORMAT_COLS = [0, 1, 2, 3, 4, 5, 7, 8]
+
+def draw_dummy_format_bits(matrice, functie, marime):
+    # Astea-s placeholders pt bitii despre error correction
+    # coltul din stanga sus (fara linia/coloana 6, acolo e timing)
+    matrice[8, FORMAT_COLS] = matrice[FORMAT_COLS, 8] = 0
+    functie[8, FORMAT_COLS] = functie[FORMAT_COLS, 8] = True
+    # coltul din dreapta si cel din stanga jos
+    matrice[8, marime - 8:] = matrice[marime - 8:, 8] = 0
+    functie[8, marime - 8:] = functie[marime - 8:, 8] = True
+    # modulul negru de langa finderul din stanga jos
+    matrice[marime - 8, 8] = 1
+
+def am_loc(functie, y, x):
     # in functia asta verific daca sunt pe o pozitie valida, cand imi pun alignment patterns (patratelele mici)
-    if matrice[y][x] != 8:
-        return False
-    if matrice[y - 2][x - 2] != 8 or matrice[y - 2][x + 2] != 8 or matrice[y + 2][x - 2] != 8 or matrice[y + 2][
-        x + 2] != 8:
-        return False
-    return True
+    return not (functie[y, x] or functie[y - 2, x - 2] or functie[y - 2, x + 2] or
+                functie[y + 2, x - 2] or functie[y + 2, x + 2])
 
 def calculate_alignment_coords(versiune):
     # aici incercam sa caluclez coordonatele pt fiecare versiune pana mi-am dat seama ca dureaza mult si n-are rost
@@ -131,26 +123,13 @@ def get_alignment_pattern_positions(v):
     }
     return alignment_positions.get(v, [])
 
-def draw_alignment_patterns(matrice, versiune):
-    # functia asta e destul de lenesa...
+def draw_alignment_patterns(matrice, functie, versiune):
     L = get_alignment_pattern_positions(versiune)
-    # print(L)    #DEBUGGING
     for i in L:
         for j in L:
-            if am_loc(matrice, i, j):
-                i -= 2
-                j -= 2
-                for x in range(5):  # desenex patrat 5x5 negru
-                    for y in range(5):
-                        matrice[i + y][j + x] = 1
-                i += 1
-                j += 1
-                for x in range(3):  # desenex patrat 3x3 alb
-                    for y in range(3):
-                        matrice[i + y][j + x] = 0
-                j += 1
-                i += 1
-                matrice[i][j] = 1  # desenex un pixel negru
+            if am_loc(functie, i, j):
+                matrice[i - 2:i + 3, j - 2:j + 3] = ALIGNMENT
+                functie[i - 2:i + 3, j - 2:j + 3] = True
 
 def calculate_version_information(v):
     if v < 7:
@@ -173,80 +152,64 @@ def calculate_version_information(v):
     vinfo = (v << 12) | vbits
     return f"{vinfo:018b}"
 
-def draw_version_information(matrice, versiune, marime):
+# cei 18 biti de versiune pentru v7..v40, calculati o singura data (0 pentru versiunile mici)
+VERSION_WORDS = [0] * 7 + [int(calculate_version_information(v), 2) for v in range(7, 41)]
+
+def draw_version_information(matrice, functie, versiune, marime):
     # Cu astea se deseneaza cei 18 biti de informatie pentru versiune
     if versiune < 7:
         return None
-    aux = bitString = calculate_version_information(versiune)[::-1]
-    for j in range(6):
-        for i in range(marime - 11, marime - 8):
-            matrice[i][j] = int(bitString[0])
-            bitString = bitString[1:]
-    bitString = aux
-    for i in range(6):
-        for j in range(marime - 11, marime - 8):
-            matrice[i][j] = int(bitString[0])
-            bitString = bitString[1:]
-
-def zigzag(matrix):
+    # bitul k (incepand cu cel mai putin semnificativ) sta pe linia k // 3, coloana k % 3
+    vinfo = VERSION_WORDS[versiune]
+    bloc = ((vinfo >> np.arange(18)) & 1).astype(np.uint8).reshape(6, 3)
+    matrice[0:6, marime - 11:marime - 8] = bloc
+    matrice[marime - 11:marime - 8, 0:6] = bloc.T
+    functie[0:6, marime - 11:marime - 8] = True
+    functie[marime - 11:marime - 8, 0:6] = True
+
+def zigzag(functie):
     # Creat de Alex :3
-    l = len(matrix)
-    rev = 0
-    correction = 0
-    rez = []
-    for k in range(l // 2):
-        if k == l // 2 - 3:
-            correction = -1
-        if rev == 0:
-            for i in range(l - 1, -1, -1):
-                for j in range(l - k * 2 - 1 + correction, l - k * 2 - 3 + correction, -1):
-                    if matrix[i][j] == 8:
-                        rez.append((i, j))
-            rev = 1
-        else:
-            for i in range(0, l):
-                for j in range(l - k * 2 - 1 + correction, l - k * 2 - 3 + correction, -1):
-                    if matrix[i][j] == 8:
-                        rez.append((i, j))
-            rev = 0
-    return rez
-
-def save_bits(matrice, msg):
-    L = zigzag(matrice)
-    if len(L) > len(msg):
-        x = len(L) - len(msg)
-        msg = msg + ("0" * x)
-    while L:
-        i, j = L[0]
-        matrice[i][j] = int(msg[0])
-        msg = msg[1:]
-        L = L[1:]
-
-def apply_mask(matrix, mask_id, template,ECL):
-    size = len(matrix)
-    masked_matrix = copy.deepcopy(matrix)
-    for row in range(size):
-        for col in range(size):
-            apply = False
-            if mask_id == 0:
-                apply = (row + col) % 2 == 0
-            elif mask_id == 1:
-                apply = row % 2 == 0
-            elif mask_id == 2:
-                apply = col % 3 == 0
-            elif mask_id == 3:
-                apply = (row + col) % 3 == 0
-            elif mask_id == 4:
-                apply = (row // 2 + col // 3) % 2 == 0
-            elif mask_id == 5:
-                apply = (row * col) % 2 + (row * col) % 3 == 0
-            elif mask_id == 6:
-                apply = ((row * col) % 2 + (row * col) % 3) % 2 == 0
-            elif mask_id == 7:
-                apply = ((row + col) % 2 + (row * col) % 3) % 2 == 0
-
-            if apply and template[row][col] == 8:
-                masked_matrix[row][col] ^= 1
+    # Returneaza indicii (in matricea aplatizata) modulelor de date, in ordinea in care se pun bitii:
+    # perechi de coloane de la dreapta la stanga (sarind coloana 6), alternativ in sus si in jos
+    marime = len(functie)
+    dreapta = np.concatenate([np.arange(marime - 1, 6, -2), np.arange(5, 0, -2)])
+    sus = (np.arange(len(dreapta)) % 2 == 0)[:, None]
+    linii = np.where(sus, np.arange(marime - 1, -1, -1), np.arange(marime))
+    coloane = dreapta[:, None, None] - np.array([0, 1])
+    ordine = (linii[:, :, None] * marime + coloane).ravel()
+    return ordine[~functie.ravel()[ordine]]
+
+def save_bits(matrice, functie, msg):
+    L = zigzag(functie)
+    biti = np.frombuffer(msg.encode('ascii'), dtype=np.uint8)[:len(L)] - ord('0')
+    # daca mesajul e mai scurt decat locul disponibil, restul modulelor raman 0
+    plat = matrice.reshape(-1)
+    plat[L[:len(biti)]] = biti
+    plat[L[len(biti):]] = 0
+
+def mask_planes(marime):
+    return _cached(_MASK_PLANES, marime, _build_mask_planes)
+
+def _build_mask_planes(marime):
+    # Cele 8 masti pentru o marime data, calculate o singura data: un array bool (8, marime, marime)
+    # in care modulele functionale sunt deja scoase, ca sa putem aplica masca cu un singur XOR
+    row, col = np.indices((marime, marime))
+    planes = np.stack([
+        (row + col) % 2 == 0,
+        row % 2 == 0,
+        col % 3 == 0,
+        (row + col) % 3 == 0,
+        (row // 2 + col // 3) % 2 == 0,
+        (row * col) % 2 + (row * col) % 3 == 0,
+        ((row * col) % 2 + (row * col) % 3) % 2 == 0,
+        ((row + col) % 2 + (row * col) % 3) % 2 == 0,
+    ])
+    _, functie = get_template((marime - 21) // 4 + 1)
+    planes &= ~functie
+    return planes
+
+def apply_mask(matrix, mask_id, ECL):
+    masked_matrix = matrix ^ mask_planes(len(matrix))[mask_id]
     draw_format_bits(masked_matrix, ECL,mask_id)
     return masked_matrix
 
@@ -279,132 +242,205 @@ def calculate_format_string(ecl, mask):
 
     return f"{format_string:015b}"
 
+# toate cele 32 de cuvinte de format (ECL, masca), ca intregi pe 15 biti
+FORMAT_WORDS = {(ecl, mask): int(calculate_format_string(ecl, mask), 2) for ecl in 'LMQH' for mask in range(8)}
+
+def format_bits(ecl, mask_id):
+    # bitii cuvantului de format, de la cel mai semnificativ la cel mai putin semnificativ
+    return (FORMAT_WORDS[(ecl, mask_id)] >> np.arange(14, -1, -1)) & 1
+
+def format_positions(marime):
+    return _cached(_FORMAT_POSITIONS, marime, _build_format_positions)
+
+def _build_format_positions(marime):
+    # unde ajunge bitul k din sirul de format, in cele doua copii
+    # prima copie: linia 8 in coltul stanga sus, apoi coloana 8 in sus
+    linii1 = np.array([8] * 8 + [7, 5, 4, 3, 2, 1, 0])
+    coloane1 = np.array(FORMAT_COLS + [8] * 7)
+    # a doua copie: coloana 8 in stanga jos (de jos in sus), apoi linia 8 in dreapta sus
+    linii2 = np.array([marime - 1 - i for i in range(7)] + [8] * 8)
+    coloane2 = np.array([8] * 7 + [marime - 8 + i for i in range(8)])
+    return np.concatenate([linii1, linii2]), np.concatenate([coloane1, coloane2])
+
 def draw_format_bits(matrix,ecl,mask_id):
-    marime = len(matrix)
-    bitString = calculate_format_string(ecl, mask_id)
-    #aici memorez in coltu stanga sus
-    aux = bitString[::1]
-    for i in range(9):
-        if i == 6:
-            continue
-        matrix[8][i] = int(aux[0])
-        aux = aux[1:]
-    for i in range(8):
-        if i == 1:
-            continue
-        matrix[7-i][8] = int(aux[0])
-        aux = aux[1:]
-
-    #aici o sa memorez in coltul din dreapta
-    aux = bitString[7:]
-    for i in range(8):
-        matrix[8][marime-8+i] = int(aux[0])
-        aux = aux[1:]
-    aux = bitString[:7]
-    #aici memorez in coltul din stanga
-    for i in range(7):
-        matrix[marime-1-i][8] = int(aux[0])
-        aux = aux[1:]
-
-def transpose_matrix(matrix):
-    return [list(row) for row in zip(*matrix)]
+    linii, coloane = format_positions(len(matrix))
+    matrix[linii, coloane] = np.tile(format_bits(ecl, mask_id), 2)
+
+# Scorurile de penalizare se calculeaza pe o stiva (K, N, N) de candidati (de obicei cele 8 masti),
+# toate odata; pasii verticali sunt aceiasi pasi pe stiva transpusa.
+
+def _as_stack(matrix):
+    return np.asarray(matrix, dtype=np.uint8)[None]
+
+def _run_penalty(stack):
+    # granitele dintre serii (plus capetele fiecarei linii) -> lungimile seriilor din np.diff
+    K, N, _ = stack.shape
+    granite = np.ones((K, N, N + 1), dtype=bool)
+    granite[:, :, 1:N] = stack[:, :, 1:] != stack[:, :, :-1]
+    pozitii = np.flatnonzero(granite)
+    lungimi = np.diff(pozitii)
+    # trecerea de la o linie la alta da o "serie" de lungime 1, care oricum nu se puncteaza
+    lungi = lungimi >= 5
+    candidat = pozitii[:-1][lungi] // (N * (N + 1))
+    return np.bincount(candidat, weights=lungimi[lungi] - 2, minlength=K).astype(np.int64)
+
+def _block_penalty(stack):
+    colt = stack[:, :-1, :-1]
+    egal = (colt == stack[:, :-1, 1:]) & (colt == stack[:, 1:, :-1]) & (colt == stack[:, 1:, 1:])
+    return 3 * egal.sum(axis=(1, 2), dtype=np.int64)
+
+FINDER_LIKE = (0b00001011101, 0b10111010000)
+FINDER_EDGE = 0b1011101
+
+def _finder_penalty(stack):
+    # fiecare fereastra de 11 module devine un numar pe 11 biti si il comparam cu cele doua modele
+    N = stack.shape[-1]
+    fereastra = np.zeros(stack.shape[:-1] + (N - 10,), dtype=np.int16)
+    for k in range(11):
+        fereastra <<= 1
+        fereastra |= stack[..., k:k + N - 10]
+    count = ((fereastra == FINDER_LIKE[0]) | (fereastra == FINDER_LIKE[1])).sum(axis=(1, 2), dtype=np.int64)
+    # si modelele lipite de margine (in afara matricei consideram alb)
+    stanga = np.zeros(stack.shape[:-1], dtype=np.int16)
+    dreapta = np.zeros(stack.shape[:-1], dtype=np.int16)
+    for k in range(7):
+        stanga = (stanga << 1) | stack[..., k]
+        dreapta = (dreapta << 1) | stack[..., N - 7 + k]
+    count += (stanga == FINDER_EDGE).sum(axis=1) + (dreapta == FINDER_EDGE).sum(axis=1)
+    return count * 40
+
+def _dark_penalty(stack):
+    N = stack.shape[-1]
+    ratio = (stack.sum(axis=(1, 2)) / (N * N) * 100).astype(np.int64)
+    ratio = np.abs(ratio - 50)
+    return np.where(ratio <= 5, 0, ratio // 5 - (ratio % 5 == 0))
+
+def penalty_scores(stack):
+    # Primeste o stiva (K, N, N) de candidati si returneaza cele K scoruri
+    stack = np.asarray(stack, dtype=np.uint8)
+    transpusa = stack.transpose(0, 2, 1)
+    scor = _finder_penalty(stack) + _finder_penalty(transpusa)
+    scor += _run_penalty(stack) + _run_penalty(transpusa)
+    scor += _block_penalty(stack)
+    scor += _dark_penalty(stack) * 10
+    return scor
 
 def count_horizontal_patterns(matrix):
-    size = len(matrix)
-    count = 0
-    for row in matrix:
-        streak = 1
-        for col in range(1, size):
-            if row[col] == row[col - 1]:
-                streak += 1
-            else:
-                if streak >= 5:
-                    count += streak - 2
-                streak = 1
-        if streak >= 5:
-            count += streak - 2
-
-    return count
+    return int(_run_penalty(_as_stack(matrix))[0])
 
 def count_vertical_patterns(matrix):
-    transposed = transpose_matrix(matrix)
-    return count_horizontal_patterns(transposed)
+    return int(_run_penalty(_as_stack(matrix).transpose(0, 2, 1))[0])
 
 def count_2x2_patterns(matrix):
-    size = len(matrix)
-    count = 0
-
-    for row in range(size - 1):
-        for col in range(size - 1):
-            if (matrix[row][col] == matrix[row][col + 1] ==
-                    matrix[row + 1][col] == matrix[row + 1][col + 1]):
-                count += 3
-
-    return count
+    return int(_block_penalty(_as_stack(matrix))[0])
 
 def find_horizontal_finder_patterns(matrix):
-#TE ROG REPARA FUNCTIA ASTA, PT CA NU SE CALCULEAZA CORECT :(((((((((((((
-    count = 0
-    for linie in matrix:
-        #asta-i pt cele din mijloc
-        for i in range(len(linie)-10):
-            if linie[i:i+11] == [0,0,0,0,1,0,1,1,1,0,1] or linie[i:i+11] == [1,0,1,1,1,0,1,0,0,0,0]:
-                count+=1
-        #asta-i pt cele din marginea stanga
-        if linie[:7]==[1,0,1,1,1,0,1]:
-            count+=1
-        #asta-i pt cele din marginea dreapta
-        if linie[len(linie)-7:] == [1,0,1,1,1,0,1]:
-            count+=1
-
-    return count*40
+    return int(_finder_penalty(_as_stack(matrix))[0])
 
 def find_vertical_finder_patterns(matrix):
-    transposed = transpose_matrix(matrix)
-    return find_horizontal_finder_patterns(transposed)
+    return int(_finder_penalty(_as_stack(matrix).transpose(0, 2, 1))[0])
 
 def dark_light_ratio(matrix):
-    size = len(matrix)
-    total_modules = size * size
-    dark_modules = sum(sum(row) for row in matrix)
-    ratio = int((dark_modules / total_modules) * 100)
-    if ratio < 50:
-        ratio = 50 - ratio
+    return int(_dark_penalty(_as_stack(matrix))[0])
+
+def mask_candidates(matrix, ECL):
+    # toate cele 8 variante mascate (cu bitii de format), intr-o stiva (8, N, N)
+    stack = matrix[None] ^ mask_planes(len(matrix))
+    linii, coloane = format_positions(len(matrix))
+    biti = np.stack([format_bits(ECL, mask_id) for mask_id in range(8)])
+    stack[:, linii, coloane] = np.tile(biti, 2)
+    return stack
+
+def find_best_mask(matrix, ECL):
+    # la egalitate castiga masca cu indicele mai mic
+    return int(np.argmin(penalty_scores(mask_candidates(matrix, ECL))))
+
+def draw_template(versiune):
+    # Deseneaza doar modelele functionale si returneaza (matrice, functie)
+    marime = (versiune - 1) * 4 + 21
+    matrice, functie = new_matrix(marime)
+    draw_finders(matrice, functie, marime)
+    draw_alignment_patterns(matrice, functie, versiune)
+    draw_dummy_format_bits(matrice, functie, marime)
+    timing_patterns(matrice, functie, marime)
+    draw_version_information(matrice, functie, versiune, marime)
+    return matrice, functie
+
+# Sabloanele (modelele functionale) pentru fiecare versiune se deseneaza o singura data, la prima
+# cerere, si apoi sunt doar citite; lock-ul le face sigure cand codam din mai multe thread-uri.
+_TEMPLATES = {}
+_MASK_PLANES = {}
+_FORMAT_POSITIONS = {}
+_PLACEMENT_PLANS = {}
+_CACHE_LOCK = threading.RLock()
+
+def _cached(cache, key, build):
+    value = cache.get(key)
+    if value is None:
+        with _CACHE_LOCK:
+            value = cache.get(key)
+            if value is None:
+                value = build(key)
+                for array in (value if isinstance(value, tuple) else (value,)):
+                    array.flags.writeable = False
+                cache[key] = value
+    return value
+
+def get_template(versiune):
+    # Returneaza (matrice, functie) read-only pentru versiunea data; se copiaza inainte de folosire
+    return _cached(_TEMPLATES, versiune, draw_template)
+
+def placement_plan(versiune, ECL):
+    # Pentru fiecare bit din fluxul de codewords in ordinea blocurilor (date, apoi ECC),
+    # indicele modulului (in matricea aplatizata) unde ajunge; imbina intercalarea cu zigzag-ul
+    return _cached(_PLACEMENT_PLANS, (versiune, ECL), _build_placement_plan)
+
+def _build_placement_plan(key):
+    versiune, ECL = key
+    ordine = zigzag(get_template(versiune)[1])
+    perm = np.array(rs.interleave_order(versiune, ECL))
+    plan = np.empty(8 * len(perm), dtype=np.intp)
+    plan[(8 * perm[:, None] + np.arange(8)).ravel()] = ordine[:8 * len(perm)]
+    return plan
+
+def place_codewords(matrice, versiune, ECL, codewords):
+    # codewords vin in ordinea blocurilor, ca de la rs.block_codewords
+    biti = np.unpackbits(np.frombuffer(bytes(codewords), dtype=np.uint8))
+    matrice.reshape(-1)[placement_plan(versiune, ECL)] = biti
+
+def masked_mat(versiune, msg, ECL):
+#Pune mesajul in sablon si aplica cea mai buna masca
+#Returneaza (matrice, masca)
+    sablon, functie = get_template(versiune)
+    matrice = sablon.copy()
+    if isinstance(msg, str):
+        save_bits(matrice, functie, msg)
     else:
-        ratio -= 50
-    if ratio <=5:
-        return 0
-    ratio = (ratio//5) + (-1 if ratio%5 == 0 else 0)
-    return ratio
-
-def find_best_mask(matrix, template,ECL):
-    rez = []
-    for i in range(8):
-        cnt = 0
-        mask = apply_mask(matrix, i, template,ECL)
-        cnt += find_horizontal_finder_patterns(mask)+find_vertical_finder_patterns(mask)
-        cnt += count_horizontal_patterns(mask)+count_vertical_patterns(mask)
-        cnt += count_2x2_patterns(mask)
-        cnt += dark_light_ratio(mask)*10
-        rez.append((i, cnt))
-    rez = sorted(rez, key=lambda x: x[1])
-    #rez[0][0] contine masca cea mai buna!!!!
-    return rez[0][0]
-
-def return_mat(versiune, msg,ECL):
-#Primeste ca parametru versiunea, sirul de biti si nivelul de corectare a erorilor
-#Returneaza un cod QR
+        place_codewords(matrice, versiune, ECL, msg)
+    masca = find_best_mask(matrice, ECL)
+    return apply_mask(matrice, masca, ECL), masca
+
+def return_mat(versiune, msg,ECL, as_list=False):
+#Primeste ca parametru versiunea, mesajul si nivelul de corectare a erorilor
+#Mesajul e fie sirul de biti intercalat (ca de la rs.final_codewords), fie bytes in ordinea blocurilor
+#(ca de la rs.block_codewords)
+#Returneaza un cod QR ca ndarray uint8 (sau ca lista de liste, cu as_list=True)
     if not (1 <= versiune <= 40):
         return None
-    marime = (versiune - 1) * 4 + 21
-    matrice = [[8] * marime for _ in range(marime)]
-    draw_finders(matrice, marime)
-    draw_alignment_patterns(matrice, versiune)
-    draw_dummy_format_bits(matrice, marime)
-    timing_patterns(matrice, marime)
-    draw_version_information(matrice, versiune, marime)
-    template = copy.deepcopy(matrice)
-    save_bits(matrice, msg)
-    matrice = apply_mask(matrice,find_best_mask(matrice, template,ECL) , template,ECL)
+    matrice, _ = masked_mat(versiune, msg, ECL)
+    if as_list:
+        return matrice.tolist()
     return matrice
 
+def return_mats(versiune, codewords, ECL):
+#Ca return_mat, dar pentru mai multe simboluri de aceeasi versiune si ECL deodata
+#codewords: array (S, total) cu codewords in ordinea blocurilor (ca rs.rs_encode_symbols)
+#Returneaza un ndarray uint8 (S, marime, marime)
+    sablon, _ = get_template(versiune)
+    codewords = np.atleast_2d(np.asarray(codewords, dtype=np.uint8))
+    S, marime = len(codewords), len(sablon)
+    matrici = np.broadcast_to(sablon, (S, marime, marime)).copy()
+    matrici.reshape(S, -1)[:, placement_plan(versiune, ECL)] = np.unpackbits(codewords, axis=1)
+    for s in range(S):
+        matrici[s] = apply_mask(matrici[s], find_best_mask(matrici[s], ECL), ECL)
+    return matrici
@@ -0,0 +1,297 @@
+"""
+Layered, content-addressed cache for the encode pipeline.
+
+Repeated payloads skip the work they already paid for, level by level:
+
+    codewords   sha256(ecl, payload)                 -> (version, block-order codewords)
+    matrices    sha256(version, ecl, codewords)      -> (mask id, final module matrix)
+    images      sha256(matrix key, format, options)  -> encoded PNG/SVG/PBM/PGM/PDF bytes
+
+Each level is an in-memory LRU bounded by a byte budget. An optional on-disk tier
+keeps the same entries as files named by their key, so a restarted process (or
+another one sharing the directory) starts warm. Every level counts hits, misses
+and evictions; stats() reports them for sizing the budgets.
+"""
+from collections import OrderedDict
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import zlib
+
+import numpy as np
+
+import main
+import reed_solomon as rs
+import render
+
+RENDERERS = {
+    'png': render.write_png,
+    'svg': render.write_svg,
+    'pdf': render.write_pdf,
+    'pbm': render.write_pbm,
+    'pgm': render.write_pgm,
+}
+
+
+def content_key(*parts):
+    """Hex SHA-256 of the parts (str, bytes or int), length-prefixed so they cannot run together."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        elif isinstance(part, int):
+            part = str(part).encode('ascii')
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU mapping bounded by the total size of its values.
+
+    Args:
+        max_bytes: budget for the sizes passed to put; the least recently used
+            entries are evicted to stay within it
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the cached value, or None (counted as a miss)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        """Stores value, accounted as size bytes. Values larger than the whole budget are not kept."""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.current_bytes, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class DiskCache:
+    """
+    Byte values stored as files under root/<level>/<key[:2]>/<key>. Writes go
+    through a temporary file and os.replace, so concurrent readers never see a
+    partial entry. Every file ends with the CRC-32 of its value, so a truncated or
+    corrupt entry is detected on read. The directory is not size-limited; prune it
+    externally. errors counts the failed reads, writes and corrupt entries QRCache skipped over.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.hits = self.misses = self.writes = self.errors = 0
+
+    def _path(self, level, key):
+        return os.path.join(self.root, level, key[:2], key)
+
+    def get(self, level, key):
+        """
+        Returns the stored value, or None if there is none.
+
+        Raises:
+            ValueError: for an entry whose checksum does not match.
+        """
+        path = self._path(level, key)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        if len(data) < 4 or zlib.crc32(data[:-4]) != int.from_bytes(data[-4:], 'big'):
+            raise ValueError(f"Corrupt cache entry {path}.")
+        self.hits += 1
+        return data[:-4]
+
+    def put(self, level, key, data):
+        path = self._path(level, key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+                file.write(zlib.crc32(data).to_bytes(4, 'big'))
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.writes += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'writes': self.writes, 'errors': self.errors}
+
+
+# ---------------------------------------------------------------------------
+# Serialization of the levels for the disk tier
+# ---------------------------------------------------------------------------
+
+def _dump_codewords(value):
+    version, codewords = value
+    return bytes([version]) + codewords
+
+
+def _load_codewords(data):
+    if len(data) < 2 or not 1 <= data[0] <= 40:
+        raise ValueError("Corrupt codewords entry.")
+    return data[0], data[1:]
+
+
+def _dump_matrix(value):
+    mask, matrix = value
+    return bytes([mask, len(matrix)]) + np.packbits(matrix, axis=1).tobytes()
+
+
+def _load_matrix(data):
+    if len(data) < 2 or len(data) != 2 + data[1] * ((data[1] + 7) // 8):
+        raise ValueError("Corrupt matrix entry.")
+    mask, size = data[0], data[1]
+    packed = np.frombuffer(data, dtype=np.uint8, offset=2).reshape(size, -1)
+    matrix = np.unpackbits(packed, axis=1, count=size)
+    matrix.flags.writeable = False
+    return mask, matrix
+
+
+class QRCache:
+    """
+    The three cache levels of the encode pipeline.
+
+    Args:
+        codeword_bytes, matrix_bytes, image_bytes: memory budget of each level
+        disk_dir: directory of the optional on-disk tier
+
+    Matrices are returned read-only, since they are shared between callers.
+    """
+
+    def __init__(self, codeword_bytes=16 << 20, matrix_bytes=64 << 20, image_bytes=256 << 20, disk_dir=None):
+        self.codeword_cache = LRUCache(codeword_bytes)
+        self.matrix_cache = LRUCache(matrix_bytes)
+        self.image_cache = LRUCache(image_bytes)
+        self.disk = DiskCache(disk_dir) if disk_dir else None
+
+    def _disk_get(self, level, key):
+        try:
+            return self.disk.get(level, key)
+        except (OSError, ValueError):
+            self.disk.errors += 1
+            return None
+
+    def _disk_put(self, level, key, data):
+        # the disk tier is best-effort: a full or read-only disk must not fail an encode
+        try:
+            self.disk.put(level, key, data)
+        except OSError:
+            self.disk.errors += 1
+
+    def _lookup(self, level, memory, key, build, size, dump, load):
+        value = memory.get(key)
+        if value is not None:
+            return value
+        data = self._disk_get(level, key) if self.disk else None
+        if data is not None:
+            try:
+                value = load(data)
+            except (IndexError, ValueError):
+                # a truncated or corrupt entry is rebuilt and rewritten
+                self.disk.errors += 1
+                data = None
+        if data is None:
+            value = build()
+            if self.disk:
+                self._disk_put(level, key, dump(value))
+        memory.put(key, value, size(value))
+        return value
+
+    def codewords(self, payload, ecl='L'):
+        """(version, block-order codeword bytes) of a payload, as rs.block_codewords."""
+        ecl = ecl.upper()
+        return self._lookup('codewords', self.codeword_cache, content_key('codewords', ecl, payload),
+                            lambda: rs.block_codewords(payload, ecl),
+                            lambda value: len(payload.encode('utf-8')) + len(value[1]) + 64,
+                            _dump_codewords, _load_codewords)
+
+    def _matrix_key(self, version, codewords, ecl):
+        return content_key('matrix', version, ecl.upper(), bytes(codewords))
+
+    def masked_matrix(self, version, codewords, ecl='L'):
+        """(mask id, matrix) for block-order codewords, as main.masked_mat."""
+        ecl = ecl.upper()
+
+        def build():
+            matrix, mask = main.masked_mat(version, bytes(codewords), ecl)
+            matrix.flags.writeable = False
+            return mask, matrix
+
+        return self._lookup('matrix', self.matrix_cache, self._matrix_key(version, codewords, ecl), build,
+                            lambda value: value[1].nbytes, _dump_matrix, _load_matrix)
+
+    def matrix(self, payload, ecl='L'):
+        """The final module matrix of a payload."""
+        version, codewords = self.codewords(payload, ecl)
+        return self.masked_matrix(version, codewords, ecl)[1]
+
+    def image(self, payload, ecl='L', fmt='png', scale=1, border=4):
+        """
+        The encoded image of a payload as bytes.
+
+        Raises:
+            ValueError: for an unknown format.
+        """
+        if fmt not in RENDERERS:
+            raise ValueError(f"Unknown image format {fmt!r}: use one of {', '.join(RENDERERS)}.")
+        version, codewords = self.codewords(payload, ecl)
+
+        def build():
+            output = io.BytesIO()
+            RENDERERS[fmt](output, self.masked_matrix(version, codewords, ecl)[1], scale, border)
+            return output.getvalue()
+
+        key = content_key('image', self._matrix_key(version, codewords, ecl), fmt, scale, border)
+        return self._lookup('image', self.image_cache, key, build, len, bytes, bytes)
+
+    def clear(self):
+        """Empties the memory levels (the disk tier is kept)."""
+        for level in (self.codeword_cache, self.matrix_cache, self.image_cache):
+            level.clear()
+
+    def stats(self):
+        stats = {'codewords': self.codeword_cache.stats(), 'matrix': self.matrix_cache.stats(),
+                 'image': self.image_cache.stats()}
+        if self.disk:
+            stats['disk'] = self.disk.stats()
+        return stats
@@ -1,8 +1,24 @@
+import argparse
 import sys
 import os
+import io
+import logging
+from dataclasses import dataclass, replace
+from itertools import combinations
+import math
 from PIL import Image
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy.ndimage import label, find_objects
+
+import main as encoder
+import reed_solomon as rs
+import data_segment as ds
+from bit_buffer import BitReader
+
+# Diagnostics go through logging and stay silent unless the caller configures it.
+logger = logging.getLogger(__name__)
+
 def add_white_border(matrix, block_size):
     """
     Adds a white border around the binary QR code matrix.
@@ -35,7 +51,7 @@ def add_white_border(matrix, block_size):
         constant_values=0
     )
 
-    print(f"Added a white border of {border_size} pixels on all sides.")
+    logger.debug("Added a white border of %d pixels on all sides.", border_size)
 
     return new_matrix
 def trim_zeros(matrix):
@@ -71,7 +87,7 @@ def trim_zeros(matrix):
     largest_component = component_sizes.argmax()
     
     # Get the bounding box of the largest component
-    slices = find_objects(labeled == largest_component)[0]
+    slices = find_objects(labeled)[largest_component - 1]
     row_min, row_max = slices[0].start, slices[0].stop
     col_min, col_max = slices[1].start, slices[1].stop
     
@@ -79,129 +95,787 @@ def trim_zeros(matrix):
     trimmed_matrix = matrix[row_min:row_max, col_min:col_max]
     
     return trimmed_matrix
-def estimate_qr_size(image_path):
+
+
+def sample_modules(binary, block_size, method='majority'):
     """
-    Estimates the QR code grid size (number of modules per side) by analyzing
-    the horizontal and vertical projection profiles of the image.
+    Reduces a binary image to one value per block_size x block_size block.
+
+    This is the fast path for an axis-aligned symbol cropped to its modules, such
+    as trim_zeros of a rendered code with a known module size; photos and rotated
+    symbols go through locate and sample_grid instead.
+
+    The image is cropped to whole blocks and viewed as (rows, block_size, cols,
+    block_size), so all blocks are handled at once instead of one np.mean per module.
 
     Args:
-        image_path (str): Path to the QR code image.
+        binary (np.ndarray): 2D array of 0/1 pixels, 1 = dark.
+        block_size (int): Size of each block (pixels per module).
+        method (str): 'majority' - a module is dark when at least half of its block
+            is; 'center' - the centre pixel of each block decides, which reads only
+            one pixel per module.
+
+    Returns:
+        np.ndarray: uint8 module matrix, 1 = dark.
+    """
+    if binary.ndim != 2:
+        raise ValueError("Input matrix must be 2-dimensional.")
+    if not isinstance(block_size, (int, np.integer)) or block_size <= 0:
+        raise ValueError("block_size must be a positive integer.")
+    rows, cols = binary.shape[0] // block_size, binary.shape[1] // block_size
+    blocks = binary[:rows * block_size, :cols * block_size].reshape(rows, block_size, cols, block_size)
+    if method == 'center':
+        return (blocks[:, block_size // 2, :, block_size // 2] != 0).astype(np.uint8)
+    if method != 'majority':
+        raise ValueError("method must be 'majority' or 'center'.")
+    # adding whole pixel rows first streams through memory; the per-block row sums are then small
+    dark = np.add.reduce(blocks, axis=1, dtype=np.uint16 if block_size < 1 << 16 else np.uint32).sum(axis=2)
+    return (2 * dark >= block_size * block_size).astype(np.uint8)
+
+
+# ---------------------------------------------------------------------------
+# Decoding: module matrix -> payload
+# ---------------------------------------------------------------------------
+
+# A format or version word is accepted up to this many bit errors away from a valid one;
+# valid words are at least 7 (format) and 8 (version) bits apart.
+MAX_INFO_ERRORS = 3
+FORMAT_WEIGHTS = 1 << np.arange(14, -1, -1)
+VERSION_WEIGHTS = 1 << np.arange(18)
+MODE_NAMES = {indicator: mode for mode, indicator in ds.MODE_INDICATORS.items()}
+ECI_INDICATOR = 0b0111
+# ECI assignment numbers of the character sets byte segments are commonly in
+ECI_CHARSETS = {1: 'latin-1', 3: 'latin-1', 20: 'shift_jis', 26: 'utf-8', 27: 'ascii'}
+
+
+@dataclass(frozen=True)
+class DecodedSymbol:
+    """
+    Result of decoding one symbol.
+
+    Attributes:
+        text: the payload.
+        version, ecl, mask: symbol parameters read from the code.
+        segments: ((mode, text), ...) as stored in the symbol.
+        corrected: number of codewords fixed by Reed-Solomon decoding.
+        location: SymbolLocation in the image (None when decoded from a matrix).
+    """
+    text: str
+    version: int
+    ecl: str
+    mask: int
+    segments: tuple
+    corrected: int
+    location: object = None
+
+
+def _closest_word(words, candidates):
+    """The (key, distance) of the candidate nearest in Hamming distance to any of the read words."""
+    return min(((key, (word ^ valid).bit_count()) for word in words for key, valid in candidates),
+               key=lambda item: item[1])
+
+
+def read_format(modules):
+    """
+    Reads the error correction level and mask from the two format copies.
 
     Returns:
-        int: Estimated number of modules per side of the QR code.
+        tuple: (ecl, mask id).
+
+    Raises:
+        ValueError: if neither copy is within MAX_INFO_ERRORS bits of a valid word.
     """
-    # Load and convert the image to grayscale
-    image = Image.open(image_path).convert("L")
-    image_array = np.array(image)
+    rows, cols = encoder.format_positions(len(modules))
+    bits = modules[rows, cols].astype(np.int64)
+    words = (int(bits[:15] @ FORMAT_WEIGHTS), int(bits[15:] @ FORMAT_WEIGHTS))
+    (ecl, mask), distance = _closest_word(words, encoder.FORMAT_WORDS.items())
+    if distance > MAX_INFO_ERRORS:
+        raise ValueError("Format information is unreadable.")
+    return ecl, mask
 
-    # Compute the horizontal and vertical projection (sum of pixel values)
-    horizontal_sum = np.sum(image_array, axis=1)
-    vertical_sum = np.sum(image_array, axis=0)
 
-    # Compute absolute differences to find transitions
-    h_diff = np.abs(np.diff(horizontal_sum))
-    v_diff = np.abs(np.diff(vertical_sum))
+def read_version_info(modules):
+    """
+    The version named by the two version information blocks (present from version
+    7 on), or None if neither is within MAX_INFO_ERRORS bits of a valid word.
 
-    # Determine dynamic thresholds using the 90th percentile
-    h_threshold = np.percentile(h_diff, 90)
-    v_threshold = np.percentile(v_diff, 90)
+    The blocks sit next to the top-right and bottom-left finder patterns, so they
+    are read correctly even from a grid sampled a module too large or too small.
+    """
+    size = len(modules)
+    if size < 45:
+        return None
+    top_right = modules[0:6, size - 11:size - 8].ravel().astype(np.int64)
+    bottom_left = modules[size - 11:size - 8, 0:6].T.ravel().astype(np.int64)
+    words = (int(top_right @ VERSION_WEIGHTS), int(bottom_left @ VERSION_WEIGHTS))
+    read, distance = _closest_word(words, enumerate(encoder.VERSION_WORDS[7:], 7))
+    return read if distance <= MAX_INFO_ERRORS else None
 
-    # Find peaks where the difference exceeds the threshold
-    h_peaks = np.where(h_diff > h_threshold)[0]
-    v_peaks = np.where(v_diff > v_threshold)[0]
 
-    # Estimate grid size (number of modules)
-    # The number of peaks corresponds to transitions between modules
-    # Number of modules = number of transitions + 1
-    estimated_size = min(len(h_peaks), len(v_peaks)) 
+def read_version(modules):
+    """
+    The version of a symbol: from its size, checked against the version
+    information blocks from version 7 on. read_modules already resamples a grid
+    whose size disagrees with its version information.
 
-    print(f"Estimated QR Grid Size: {estimated_size}x{estimated_size}")
+    Raises:
+        ValueError: for a size no version has, or version information that names
+            another version.
+    """
+    size = len(modules)
+    if modules.shape != (size, size) or size < 21 or size > 177 or (size - 17) % 4:
+        raise ValueError(f"A QR code is square with 21 to 177 modules per side in steps of 4, got {modules.shape}.")
+    version = (size - 17) // 4
+    read = read_version_info(modules)
+    if read is not None and read != version:
+        raise ValueError(f"The version information says version {read}, the size says {version}.")
+    return version
 
-    v = round((estimated_size - 21) / 4)+1  # Estimate the nearest v
-    nearest_size = max(21, (v - 1) * 4 + 21)  # Ensure v is at least 1
-    print(f"Nearest QR Grid Size: {nearest_size}")
-    return estimated_size, nearest_size
 
-def compute_block_size(image_width, image_height, grid_size):
+def read_codewords(modules, version, ecl, mask):
     """
-    Computes the optimal block size based on image dimensions and QR grid size.
+    Unmasks the symbol and reads its codewords, data blocks then ECC blocks.
+
+    The placement plan maps every bit of that block-order stream to its module, so
+    reading is one fancy index: it already undoes both the zigzag placement and the
+    block interleaving.
+    """
+    unmasked = modules ^ encoder.mask_planes(len(modules))[mask]
+    return np.packbits(unmasked.ravel()[encoder.placement_plan(version, ecl)])
+
+
+def _read_numeric(reader, count, charset):
+    digits = []
+    # groups of 3 digits in 10 bits, then a last group of 2 (7 bits) or 1 (4 bits)
+    groups = [3] * (count // 3) + ([count % 3] if count % 3 else [])
+    for width in groups:
+        value = reader.read_bits(ds.NUMERIC_GROUP_BITS[width])
+        if value >= 10 ** width:
+            raise ValueError(f"Invalid numeric group {value}.")
+        digits.append(f"{value:0{width}d}")
+    return ''.join(digits)
+
+
+def _read_alphanumeric(reader, count, charset):
+    chars = []
+    for _ in range(count // 2):
+        value = reader.read_bits(11)
+        if value >= 45 * 45:
+            raise ValueError(f"Invalid alphanumeric pair {value}.")
+        chars.append(ds.ALPHANUMERIC_CHARSET[value // 45] + ds.ALPHANUMERIC_CHARSET[value % 45])
+    if count % 2:
+        value = reader.read_bits(6)
+        if value >= 45:
+            raise ValueError(f"Invalid alphanumeric character {value}.")
+        chars.append(ds.ALPHANUMERIC_CHARSET[value])
+    return ''.join(chars)
+
+
+def _read_byte(reader, count, charset):
+    data = reader.read_bits(8 * count).to_bytes(count, 'big')
+    if charset:
+        return data.decode(charset, errors='replace')
+    # no ECI: our encoder writes UTF-8; ISO-8859-1 is the standard's default
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+def _read_kanji(reader, count, charset):
+    data = bytearray()
+    for _ in range(count):
+        value = reader.read_bits(13)
+        code = (value // 0xC0) << 8 | value % 0xC0
+        code += 0x8140 if code + 0x8140 <= 0x9FFC else 0xC140
+        data += code.to_bytes(2, 'big')
+    return data.decode('shift_jis', errors='replace')
+
+
+SEGMENT_READERS = {
+    'numeric': _read_numeric,
+    'alphanumeric': _read_alphanumeric,
+    'byte': _read_byte,
+    'kanji': _read_kanji,
+}
+
+
+def _read_eci(reader):
+    first = reader.read_bits(8)
+    if first < 0x80:
+        return first
+    if first < 0xC0:
+        return (first & 0x3F) << 8 | reader.read_bits(8)
+    return (first & 0x1F) << 16 | reader.read_bits(16)
+
+
+def parse_segments(data, version):
+    """
+    Splits the data codewords into (mode, text) segments, up to the terminator.
+
+    Raises:
+        ValueError: for an unsupported mode or a segment that runs past the data.
+    """
+    reader = BitReader(data)
+    segments = []
+    charset = None
+    while reader.remaining() >= 4:
+        indicator = reader.read_bits(4)
+        if indicator == 0:
+            break
+        if indicator == ECI_INDICATOR:
+            charset = ECI_CHARSETS.get(_read_eci(reader), charset)
+            continue
+        mode = MODE_NAMES.get(indicator)
+        if mode is None:
+            raise ValueError(f"Unsupported mode indicator {indicator:04b}.")
+        count = reader.read_bits(ds.count_bits(mode, version))
+        segments.append((mode, SEGMENT_READERS[mode](reader, count, charset)))
+    return segments
+
+
+def decode_matrix(modules):
+    """
+    Decodes a sampled module matrix to its payload.
 
     Args:
-        image_width (int): Width of the image in pixels.
-        image_height (int): Height of the image in pixels.
-        grid_size (int): Number of modules per side of the QR code.
+        modules (np.ndarray): square 0/1 matrix, 1 = dark, as from sample_grid.
 
     Returns:
-        int: Calculated block size (pixels per module).
+        DecodedSymbol
+
+    Raises:
+        ValueError: if the symbol cannot be read or corrected.
+    """
+    modules = np.asarray(modules, dtype=np.uint8)
+    version = read_version(modules)
+    ecl, mask = read_format(modules)
+    codewords = read_codewords(modules, version, ecl, mask)
+    data, corrected = rs.rs_decode_symbol(codewords, version, ecl)
+    segments = parse_segments(data, version)
+    return DecodedSymbol(''.join(text for _, text in segments), version, ecl, mask, tuple(segments), corrected)
+
+
+# ---------------------------------------------------------------------------
+# Locating the symbol: finder patterns
+# ---------------------------------------------------------------------------
+
+# Along any line through its centre a finder pattern crosses dark, light, dark,
+# light, dark runs in the ratio 1:1:3:1:1.
+FINDER_RATIOS = np.array([1, 1, 3, 1, 1])
+# A run may differ from its expected width by this fraction of it.
+FINDER_TOLERANCE = 0.5
+# Smallest module size the locator supports, in pixels; bounds how many rows may be
+# skipped, whatever part of the frame the symbol covers.
+MIN_MODULE_SIZE = 2
+# Finder centres of the smallest symbol (version 1) are 14 modules apart.
+MIN_FINDER_SPACING = 14
+# Candidates, most supported first, whose triples locate tries.
+MAX_FINDERS = 12
+
+
+@dataclass(frozen=True)
+class SymbolLocation:
     """
-    block_size_width = image_width // grid_size
-    block_size_height = image_height // grid_size
-    block_size = min(block_size_width, block_size_height)
+    Where a symbol lies in the image.
+
+    Attributes:
+        top_left, top_right, bottom_left: finder pattern centres as (x, y) pixels.
+        module_size: pitch in pixels.
+        version, size: version estimated from the finder distances (or read from the
+            version information when they disagree), and its size in modules.
+        rotation: angle of the top edge in degrees, clockwise (0 = upright).
+    """
+    top_left: tuple
+    top_right: tuple
+    bottom_left: tuple
+    module_size: float
+    version: int
+    size: int
+    rotation: float
 
-    print(f"Calculated Block Size: {block_size} pixels per module")
 
-    return block_size
-def main():
+def _finder_ratio_ok(lengths):
+    """Which rows of an (n, 5) array of run lengths match 1:1:3:1:1."""
+    unit = lengths.sum(axis=-1, keepdims=True) / 7
+    expected = unit * FINDER_RATIOS
+    return (np.abs(lengths - expected) < expected * FINDER_TOLERANCE).all(axis=-1) & (unit[:, 0] >= 1)
 
 
-    image_path = sys.argv[1]
-    image = Image.open(image_path).convert('L')
+def _row_candidates(binary, step):
+    """
+    Scans every step-th row for 1:1:3:1:1 runs, all rows at once.
 
-    img = np.array(image)
+    The rows are padded with a light pixel on each side and flattened, so run
+    boundaries never cross rows except through light runs, which are rejected.
 
-    binarr = np.where(img > 128, 0, 1).astype(np.uint8)
+    Returns:
+        (x, y, unit) float arrays of the candidate centres and module sizes.
+    """
+    rows = binary[::step]
+    width = rows.shape[1] + 2
+    padded = np.zeros((rows.shape[0], width), dtype=np.int8)
+    padded[:, 1:-1] = rows != 0
+    flat = padded.ravel()
+    bounds = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    if len(bounds) < 6:
+        return np.empty(0), np.empty(0), np.empty(0)
+    lengths = np.diff(bounds)
+    windows = sliding_window_view(lengths, 5)
+    starts = bounds[:len(windows)]
+    row = starts // width
+    ok = (flat[starts] == 1) & (row == (bounds[5:] - 1) // width) & _finder_ratio_ok(windows)
+    k = np.flatnonzero(ok)
+    x = bounds[k + 2] + lengths[k + 2] / 2 - row[k] * width - 1
+    return x, row[k] * step + 0.5, windows[k].sum(axis=1) / 7
+
+
+def _cluster_candidates(x, y, unit, step):
+    """Groups candidates of the same pattern. Returns [(x, y, unit, support), ...]."""
+    clusters = []
+    # candidates come in row order, so only clusters that reached the previous rows can grow
+    active = []
+    for cx, cy, cu in sorted(zip(x.tolist(), y.tolist(), unit.tolist()), key=lambda c: c[1]):
+        active = [cluster for cluster in active if cy - cluster[4] <= step + cluster[2] / cluster[3]]
+        for cluster in active:
+            sx, sy, su, n, _ = cluster
+            mean_u = su / n
+            if abs(cx - sx / n) < mean_u and 0.5 < cu / mean_u < 2:
+                cluster[:] = [sx + cx, sy + cy, su + cu, n + 1, cy]
+                break
+        else:
+            cluster = [cx, cy, cu, 1, cy]
+            clusters.append(cluster)
+            active.append(cluster)
+    return [(sx / n, sy / n, su / n, n) for sx, sy, su, n, _ in clusters]
+
+
+def _cross_check(line, center, unit):
+    """
+    Checks for the 1:1:3:1:1 runs along a line (a row or a column) whose centre run
+    covers index center.
 
-    '''
-    with open('binary1_file.out', "w") as g:
-        for row in binarr:
-            line = ' '.join(map(str, row))
-            g.write(line + '\n')
-    '''
+    Returns:
+        (refined centre, module size), or None.
+    """
+    padded = np.zeros(len(line) + 2, dtype=np.int8)
+    padded[1:-1] = line != 0
+    bounds = np.flatnonzero(np.diff(padded)) + 1
+    k = np.searchsorted(bounds, int(center) + 1, side='right') - 1
+    if k < 2 or k + 3 >= len(bounds) or padded[bounds[k]] != 1:
+        return None
+    lengths = np.diff(bounds[k - 2:k + 4])
+    found_unit = lengths.sum() / 7
+    if not _finder_ratio_ok(lengths[None])[0] or not 0.5 < found_unit / unit < 2:
+        return None
+    return bounds[k] - 1 + lengths[2] / 2, found_unit
+
+
+def find_finder_patterns(binary):
+    """
+    Finds finder pattern centres in a binary image (1 = dark): row scans for
+    1:1:3:1:1 runs, grouped per pattern and confirmed along the column and the
+    row through the centre.
+
+    Returns:
+        list of (x, y, module size, support), most supported first.
+    """
+    height, width = binary.shape
+    # the 3-module centre stone of the smallest pattern must still be crossed by two scanned rows
+    step = max(1, 3 * MIN_MODULE_SIZE // 2)
+    found = []
+    for x, y, unit, support in _cluster_candidates(*_row_candidates(binary, step), step):
+        # a real centre stone is 3 modules tall and crossed by about 3 * unit / step scanned rows
+        if support < unit / step:
+            continue
+        vertical = _cross_check(binary[:, min(int(x), width - 1)], y, unit)
+        if vertical is None:
+            continue
+        y, unit_y = vertical
+        horizontal = _cross_check(binary[min(int(y), height - 1)], x, unit)
+        if horizontal is None:
+            continue
+        x, unit_x = horizontal
+        found.append((x, y, (unit_x + unit_y) / 2, support))
+    return sorted(found, key=lambda finder: -finder[3])
+
+
+def _corner_score(a, b, c):
+    """How far three finders are from an isosceles right triangle with equal module sizes."""
+    sides = sorted((p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 for p, q in ((a, b), (b, c), (a, c)))
+    if sides[0] == 0:
+        return math.inf
+    units = (a[2], b[2], c[2])
+    return (abs(sides[2] - sides[0] - sides[1]) + abs(sides[1] - sides[0])) / sides[2] + \
+        (max(units) - min(units)) / min(units)
+
+
+def _spacing_ok(a, b, c):
+    """
+    Whether three finders are at least as far apart as in a version 1 symbol, which
+    rules out small false triangles inside the data area of a large symbol.
+    """
+    sides = [((p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2, p, q) for p, q in ((a, b), (b, c), (a, c))]
+    length, p, q = min(sides, key=lambda side: side[0])
+    # the short sides run along the module grid; sizes were measured along rows and columns
+    tilt = math.atan2(q[1] - p[1], q[0] - p[0])
+    tilt = (tilt + math.pi / 4) % (math.pi / 2) - math.pi / 4
+    unit = (a[2] + b[2] + c[2]) / 3 * math.cos(tilt)
+    return math.sqrt(length) >= 0.9 * MIN_FINDER_SPACING * unit
 
-    np.set_printoptions(threshold=np.inf)
 
-    binarr = trim_zeros(binarr)
-    grid_size,nearest = estimate_qr_size(image_path)
+def locate(binary):
+    """
+    Locates a symbol from its three finder patterns.
 
-    image_height, image_width = binarr.shape
-    block_size = compute_block_size(image_width, image_height, nearest)
+    The corner finder is the one opposite the longest side; the sign of the cross
+    product tells the top-right from the bottom-left one. Their distances in
+    modules give the size, hence the version.
 
-    # Ensure block_size is at least 1 to prevent division by zero
-    block_size = max(1, block_size)
+    Args:
+        binary (np.ndarray): 2D array, 1 = dark.
 
-    new_height = binarr.shape[0] // block_size
-    new_width = binarr.shape[1] // block_size
+    Returns:
+        SymbolLocation
+
+    Raises:
+        ValueError: if three consistent finder patterns are not found.
+    """
+    finders = find_finder_patterns(binary)[:MAX_FINDERS]
+    triples = [triple for triple in combinations(finders, 3)
+               if _corner_score(*triple) < 0.5 and _spacing_ok(*triple)]
+    if not triples:
+        raise ValueError(f"Could not find three finder patterns ({len(finders)} found).")
+    # real finders are crossed by many scanned rows; the weakest of the three decides,
+    # then the shape
+    a, b, c = min(triples, key=lambda triple: (-min(finder[3] for finder in triple), _corner_score(*triple)))
+
+    def distance(p, q):
+        return math.hypot(p[0] - q[0], p[1] - q[1])
+
+    # the corner is opposite the longest side
+    corner, p, q = max(((a, b, c), (b, a, c), (c, a, b)), key=lambda t: distance(t[1], t[2]))
+    # with y pointing down, top-right x bottom-left is positive for an upright symbol
+    if (p[0] - corner[0]) * (q[1] - corner[1]) - (p[1] - corner[1]) * (q[0] - corner[0]) < 0:
+        p, q = q, p
+    top_left, top_right, bottom_left = corner, p, q
+
+    rotation = math.degrees(math.atan2(top_right[1] - top_left[1], top_right[0] - top_left[0]))
+    # runs were measured along rows and columns, which cross a tilted pattern
+    # 1 / cos longer than its own axes do
+    tilt = math.radians((rotation + 45) % 90 - 45)
+    module_size = (top_left[2] + top_right[2] + bottom_left[2]) / 3 * math.cos(tilt)
+    modules = (distance(top_left, top_right) + distance(top_left, bottom_left)) / (2 * module_size) + 7
+    version = min(40, max(1, round((modules - 17) / 4)))
+    size = 4 * version + 17
+    return SymbolLocation(top_left[:2], top_right[:2], bottom_left[:2], module_size, version, size, rotation)
+
+
+def sample_grid(binary, location):
+    """
+    Samples every module of a located symbol.
+
+    Module centres are mapped through the affine frame of the three finder centres
+    (which handles rotation and shear, not perspective). Each module is the
+    majority of 9 pixels at -1/4, 0 and +1/4 module around its centre.
+
+    Returns:
+        np.ndarray: uint8 (size, size) module matrix, 1 = dark.
+    """
+    size = location.size
+    top_left = np.array(location.top_left)
+    # one module step along the rows and along the columns; finder centres are 6 modules in from the far side
+    across = (np.array(location.top_right) - top_left) / (size - 7)
+    down = (np.array(location.bottom_left) - top_left) / (size - 7)
+    # the finder centre is the middle of module 3
+    steps = np.arange(size) - 3.0
+    offsets = np.array([-0.25, 0.0, 0.25])
+    col = (steps[None, :] + offsets[:, None])[:, None, None, :]
+    row = (steps[None, :] + offsets[:, None])[None, :, :, None]
+    x = top_left[0] + col * across[0] + row * down[0]
+    y = top_left[1] + col * across[1] + row * down[1]
+    height, width = binary.shape
+    xs = np.clip(np.floor(x), 0, width - 1).astype(np.intp)
+    ys = np.clip(np.floor(y), 0, height - 1).astype(np.intp)
+    dark = (binary[ys, xs] != 0).sum(axis=(0, 1), dtype=np.uint8)
+    return (dark >= 5).astype(np.uint8)
+
+
+# ---------------------------------------------------------------------------
+# Binarization
+# ---------------------------------------------------------------------------
+
+BINARIZERS = ('global', 'otsu', 'mean', 'sauvola')
+# rows handled at a time by the local methods; their float work is per band, never per frame
+BAND_ROWS = 128
+# Sauvola's dynamic range of the standard deviation for 8-bit images
+SAUVOLA_R = 128
+
+
+def otsu_threshold(gray):
+    """
+    Otsu's threshold from one histogram pass: the gray level that maximizes the
+    between-class variance, computed over the 256 bins only.
+    """
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight = np.cumsum(histogram)
+    mass = np.cumsum(histogram * levels)
+    total, total_mass = weight[-1], mass[-1]
+    background = weight[:-1]
+    foreground = total - background
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (total_mass * background - total * mass[:-1]) ** 2 / (background * foreground)
+    between[(background == 0) | (foreground == 0)] = -1
+    return int(np.argmax(between))
+
+
+def integral_image(gray, squared=False):
+    """
+    Summed-area table of gray (or of its squares) with a zero first row and column,
+    so any box sum is four lookups. Uses uint32 when the total fits, else uint64.
+    """
+    height, width = gray.shape
+    largest = height * width * (255 * 255 if squared else 255)
+    dtype = np.uint32 if largest < 1 << 32 else np.uint64
+    table = np.zeros((height + 1, width + 1), dtype=dtype)
+    values = np.multiply(gray, gray, dtype=np.uint16) if squared else gray
+    np.cumsum(values, axis=1, dtype=dtype, out=table[1:, 1:])
+    # adding whole rows in turn is far faster than cumsum along axis 0 on a C-ordered array
+    for row in range(1, height + 1):
+        np.add(table[row - 1], table[row], out=table[row])
+    return table
+
+
+def _window_bounds(length, window):
+    """Start and stop of the window around every index, clipped to the image."""
+    index = np.arange(length)
+    return np.maximum(index - window // 2, 0), np.minimum(index + window // 2 + 1, length)
 
-    
-    # Initialize the reduced array
-    compressed_arr = np.zeros((new_height, new_width), dtype=int)
+
+def _box_sums(table, top, bottom, window):
+    """
+    Window sums for a band of rows (top/bottom: window rows per image row) as int64.
+
+    The column differences are one slice subtraction: the band of column sums is
+    padded with copies of its edge columns, which is what clipping the window at
+    the image edges amounts to.
+    """
+    # the table only grows downwards and rightwards, so the unsigned differences never wrap
+    columns = table[bottom] - table[top]
+    half = window // 2
+    padded = np.concatenate([np.repeat(columns[:, :1], half, axis=1), columns,
+                             np.repeat(columns[:, -1:], half, axis=1)], axis=1)
+    width = table.shape[1] - 1
+    return (padded[:, window:window + width] - padded[:, :width]).astype(np.int64)
 
 
-    # Process each 8x8 block
-    for i in range(new_height):
-        for j in range(new_width):
-            block = binarr[
-                i * block_size : (i + 1) * block_size,
-                j * block_size : (j + 1) * block_size
-            ]
-            compressed_arr[i, j] = 1 if np.mean(block) >= 0.5 else 0
+def _local_binarize(gray, window, dark_band, squared=False):
+    """
+    Runs dark_band(gray, area, sums, square_sums) over bands of rows, with the
+    window areas and box sums of the band's pixels, and collects its 0/1 output.
+    """
+    height, width = gray.shape
+    window = max(3, window | 1)
+    top, bottom = _window_bounds(height, window)
+    left, right = _window_bounds(width, window)
+    widths = right - left
+    sums = integral_image(gray)
+    squares = integral_image(gray, squared=True) if squared else None
+    out = np.empty((height, width), dtype=np.uint8)
+    for start in range(0, height, BAND_ROWS):
+        rows = slice(start, min(start + BAND_ROWS, height))
+        area = (bottom[rows] - top[rows])[:, None] * widths[None, :]
+        box = _box_sums(sums, top[rows], bottom[rows], window)
+        box_squares = _box_sums(squares, top[rows], bottom[rows], window) if squared else None
+        out[rows] = dark_band(gray[rows], area, box, box_squares)
+    return out
+
+
+def _mean_band(offset):
+    def dark(gray, area, box, box_squares):
+        # gray <= mean - offset, kept in integers: (gray + offset) * area <= sum
+        return (gray.astype(np.int64) + offset) * area <= box
+    return dark
+
+
+def _sauvola_band(k):
+    def dark(gray, area, box, box_squares):
+        # area^2 * variance exactly in integers, so float32 suffices from here on
+        deviation = np.sqrt((area * box_squares - box * box).astype(np.float32)) / area.astype(np.float32)
+        # gray <= mean * (1 + k * (deviation / R - 1)), multiplied through by the area
+        return gray * area.astype(np.float32) <= box.astype(np.float32) * (1 - k + k / SAUVOLA_R * deviation)
+    return dark
+
+
+def binarize(gray, method='global', threshold=128, window=None, k=0.2, offset=10):
+    """
+    Marks dark pixels as 1 and light ones as 0.
+
+    Args:
+        gray (np.ndarray): 2D uint8 image.
+        method (str): 'global' - a fixed threshold; 'otsu' - the threshold from
+            the histogram; 'mean' - darker than the local mean by more than offset;
+            'sauvola' - below mean * (1 + k * (deviation / 128 - 1)) over the window.
+            The local methods read window sums from summed-area tables (O(1) per pixel)
+            and cope with shadows and uneven lighting.
+        threshold (int): gray level for 'global'; a pixel at most this is dark.
+        window (int): side of the local window in pixels (default: a quarter of
+            the shorter image side).
+        k (float): Sauvola's sensitivity.
+        offset (int): margin below the local mean for 'mean'.
+
+    Returns:
+        np.ndarray: uint8 array of 0/1, same shape as gray.
+
+    Raises:
+        ValueError: for an unknown method.
+    """
+    if method == 'global':
+        return (gray <= threshold).view(np.uint8)
+    if method == 'otsu':
+        return (gray <= otsu_threshold(gray)).view(np.uint8)
+    if method not in BINARIZERS:
+        raise ValueError(f"Unknown binarization method {method!r}: use one of {', '.join(BINARIZERS)}.")
+    if window is None:
+        window = max(15, min(gray.shape) // 4)
+    if method == 'mean':
+        return _local_binarize(gray, window, _mean_band(offset))
+    return _local_binarize(gray, window, _sauvola_band(k), squared=True)
 
-    # Show the binary image
-    with open('binary_file.out', "w") as g:
-        for row in compressed_arr:
-            line = ' '.join(map(str, row))
-            g.write(line + '\n')
 
+# ---------------------------------------------------------------------------
+# Reader API: image in any form -> DecodedSymbol
+# ---------------------------------------------------------------------------
 
-    np.set_printoptions(threshold=1000)
+# ITU-R 601 luma weights in 1/256ths, for RGB arrays
+LUMA_WEIGHTS = (77, 150, 29)
 
-    binarr = add_white_border(binarr, block_size)
-    binimg_array = (1 - binarr) * 255
-    binimg = Image.fromarray(binimg_array.astype(np.uint8))
 
-    temp_path = os.getcwd() + '/emp_binary.png'
-    binimg.save(temp_path)
+def load_gray(image):
+    """
+    Gets a 2D uint8 grayscale array from an image in any supported form.
+
+    Args:
+        image: path (str or os.PathLike), encoded bytes, binary file object, PIL
+            image, or NumPy array. A 2D uint8 array (including a strided view into
+            a camera buffer) is used as is, without a copy; (H, W, 3|4) uint8
+            arrays are converted from RGB(A).
+
+    Raises:
+        TypeError: for an unsupported input type.
+        ValueError: for an array of unsupported shape or dtype.
+    """
+    if isinstance(image, np.ndarray):
+        if image.dtype != np.uint8:
+            raise ValueError(f"Expected a uint8 array, got {image.dtype}.")
+        if image.ndim == 2:
+            return image
+        if image.ndim == 3 and image.shape[2] in (3, 4):
+            gray = image[..., 0] * np.uint16(LUMA_WEIGHTS[0])
+            gray += image[..., 1] * np.uint16(LUMA_WEIGHTS[1])
+            gray += image[..., 2] * np.uint16(LUMA_WEIGHTS[2])
+            return (gray >> 8).astype(np.uint8)
+        raise ValueError(f"Expected an (H, W) or (H, W, 3|4) array, got shape {image.shape}.")
+    if isinstance(image, Image.Image):
+        return np.asarray(image if image.mode == 'L' else image.convert('L'))
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = io.BytesIO(image)
+    if isinstance(image, (str, os.PathLike)) or hasattr(image, 'read'):
+        with Image.open(image) as opened:
+            return np.asarray(opened.convert('L'))
+    raise TypeError(f"Unsupported image type {type(image).__name__}.")
+
+
+def read_modules(image, binarizer='global'):
+    """
+    Reduces a QR code image to its module matrix.
+
+    The image is loaded once; the symbol is located by its finder patterns in
+    the binarized array and sampled along their frame.
+
+    Args:
+        image: anything load_gray accepts.
+        binarizer: binarize method; 'sauvola' or 'mean' for shadows and uneven light.
+
+    Returns:
+        tuple: (module matrix as a uint8 array, 1 = dark; binary image;
+        SymbolLocation).
+    """
+    binary = binarize(load_gray(image), binarizer)
+    location = locate(binary)
+    modules = sample_grid(binary, location)
+    # the finder distances can be a module off on large tilted symbols; the
+    # BCH-protected version information is the better estimate
+    read = read_version_info(modules)
+    if read is not None and read != location.version:
+        logger.debug("Version information says version %d, the finder distances %d: resampling",
+                     read, location.version)
+        location = replace(location, version=read, size=4 * read + 17)
+        modules = sample_grid(binary, location)
+    return modules, binary, location
+
+
+def write_debug_artifacts(directory, modules, binary, location):
+    """
+    Writes the sampled grid (binary_file.out, space-separated 0/1 rows) and the
+    binarized image with a quiet zone (emp_binary.png) to directory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'binary_file.out'), "w") as g:
+        for row in modules.tolist():
+            g.write(' '.join(map(str, row)) + '\n')
+    bordered = add_white_border(trim_zeros(binary), max(1, round(location.module_size)))
+    Image.fromarray((1 - bordered) * np.uint8(255)).save(os.path.join(directory, 'emp_binary.png'))
+    logger.debug("Debug artifacts written to %s", directory)
+
+
+def decode(image, debug_dir=None, binarizer='global'):
+    """
+    Finds and decodes the QR code in an image.
+
+    Args:
+        image: path, bytes, binary file object, PIL image or uint8 NumPy array
+            (see load_gray).
+        debug_dir: if given, the sampled grid and binarized image are written there.
+        binarizer: binarize method (see BINARIZERS).
+
+    Returns:
+        DecodedSymbol, with its location set.
+
+    Raises:
+        ValueError: if no symbol is found or it cannot be decoded.
+    """
+    modules, binary, location = read_modules(image, binarizer)
+    logger.debug("Located version %d (%d modules, %.2f px/module, rotated %.1f degrees)",
+                 location.version, location.size, location.module_size, location.rotation)
+    if debug_dir is not None:
+        write_debug_artifacts(debug_dir, modules, binary, location)
+    symbol = decode_matrix(modules)
+    logger.debug("Decoded %d characters, %d codewords corrected", len(symbol.text), symbol.corrected)
+    return replace(symbol, location=location)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode the QR code in an image.")
+    parser.add_argument('image', help="image file")
+    parser.add_argument('--debug-dir', default=None,
+                        help="write the sampled grid and the binarized image to this directory")
+    parser.add_argument('--binarizer', choices=BINARIZERS, default='global',
+                        help="how pixels are split into dark and light (default: global)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log the decoding steps")
+    args = parser.parse_args()
+    logging.basicConfig(format='%(message)s')
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+
+    try:
+        symbol = decode(args.image, args.debug_dir, args.binarizer)
+    except ValueError as error:
+        print(f"Could not decode: {error}", file=sys.stderr)
+        sys.exit(1)
+    print(symbol.text)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
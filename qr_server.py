@@ -0,0 +1,471 @@
+"""
+Local HTTP encode/decode service on asyncio.
+
+    python qr_server.py --port 8080 --workers 4
+
+Endpoints:
+
+    GET  /encode?data=...&ecl=M&format=png&scale=8&border=4
+    POST /encode?ecl=M&format=svg         payload in the body (UTF-8)
+    POST /decode?binarizer=sauvola        image file in the body -> JSON with the text
+    GET  /metrics                         Prometheus text format
+    GET  /health
+
+format is one of png, svg, pdf, pbm, pgm or matrix (JSON with the module rows).
+Raster images (png, pbm, pgm) are limited to MAX_IMAGE_PIXELS pixels.
+
+The event loop only parses HTTP. Encoding and decoding run in a process pool whose
+workers import NumPy/PIL/SciPy and warm the encoder tables once, and keep a
+qr_cache.QRCache each. Encode requests that arrive together are sent to a worker
+as one batch. At most --max-in-flight requests are accepted at a time; beyond that
+the server answers 503 right away instead of queueing without bound. Connections
+are kept alive (HTTP/1.1) until the client closes them or they idle out.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import bulk_encode
+import qr_cache
+import qr_reader
+import render
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf',
+    'pbm': 'image/x-portable-bitmap',
+    'pgm': 'image/x-portable-graymap',
+    'matrix': 'application/json',
+}
+# formats whose size grows with scale and border; larger images are refused with 400
+RASTER_FORMATS = ('png', 'pbm', 'pgm')
+MAX_IMAGE_PIXELS = 1 << 26
+TEXT = 'text/plain; charset=utf-8'
+JSON = 'application/json'
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 422: 'Unprocessable Entity', 431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error', 501: 'Not Implemented', 503: 'Service Unavailable',
+}
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+# ---------------------------------------------------------------------------
+# Worker side (runs in the pool processes)
+# ---------------------------------------------------------------------------
+
+_cache = None
+
+
+def init_worker(cache_dir=None):
+    """Pool initializer: warms the encoder tables and creates the worker's cache."""
+    global _cache
+    bulk_encode.warm_caches()
+    _cache = qr_cache.QRCache(disk_dir=cache_dir)
+
+
+def _matrix_json(payload, ecl):
+    version, codewords = _cache.codewords(payload, ecl)
+    mask, matrix = _cache.masked_matrix(version, codewords, ecl)
+    rows = [row.tobytes().decode('ascii') for row in matrix + ord('0')]
+    return json.dumps({'version': version, 'ecl': ecl, 'mask': int(mask), 'size': len(matrix),
+                       'modules': rows}).encode()
+
+
+def encode_batch(jobs):
+    """
+    Encodes a batch of (payload, ecl, format, scale, border) jobs.
+
+    Returns:
+        list of (status, content type, body), one per job.
+    """
+    results = []
+    for payload, ecl, fmt, scale, border in jobs:
+        try:
+            if fmt == 'matrix':
+                body = _matrix_json(payload, ecl)
+            else:
+                if fmt in RASTER_FORMATS:
+                    # the size is known once the version is: the codewords are cached for the image anyway
+                    version, _ = _cache.codewords(payload, ecl)
+                    side = render.image_size(4 * version + 17, scale, border)
+                    if side * side > MAX_IMAGE_PIXELS:
+                        results.append((400, TEXT, f"A {side}x{side} image is over the limit of "
+                                                   f"{MAX_IMAGE_PIXELS} pixels; lower scale or border.".encode()))
+                        continue
+                body = _cache.image(payload, ecl, fmt, scale, border)
+            results.append((200, CONTENT_TYPES[fmt], body))
+        except ValueError as error:
+            results.append((422, TEXT, str(error).encode()))
+    return results
+
+
+def decode_image(data, binarizer='global'):
+    """Decodes an uploaded image with qr_reader. Returns (status, content type, body)."""
+    try:
+        symbol = qr_reader.decode(data, binarizer=binarizer)
+    except (OSError, ValueError) as error:
+        return 422, TEXT, f"Cannot decode the image: {error}".encode()
+    location = symbol.location
+    return 200, JSON, json.dumps({
+        'text': symbol.text, 'version': symbol.version, 'ecl': symbol.ecl, 'mask': symbol.mask,
+        'corrected': symbol.corrected, 'segments': [list(segment) for segment in symbol.segments],
+        'location': {'top_left': location.top_left, 'top_right': location.top_right,
+                     'bottom_left': location.bottom_left, 'module_size': location.module_size,
+                     'rotation': location.rotation},
+    }).encode()
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def expose(self, name, labels=''):
+        separator = ',' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {self.count}')
+        labels = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{labels} {self.total:.6f}')
+        lines.append(f'{name}_count{labels} {self.count}')
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.requests = defaultdict(int)
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.batch_size = Histogram(BATCH_BUCKETS)
+        self.rejected = 0
+        self.in_flight = 0
+
+    def record(self, endpoint, status, seconds):
+        self.requests[(endpoint, status)] += 1
+        self.latency[endpoint].observe(seconds)
+
+    def expose(self):
+        lines = ['# TYPE qr_requests_total counter']
+        for (endpoint, status), count in sorted(self.requests.items()):
+            lines.append(f'qr_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+        lines.append('# TYPE qr_request_seconds histogram')
+        for endpoint, histogram in sorted(self.latency.items()):
+            lines.extend(histogram.expose('qr_request_seconds', f'endpoint="{endpoint}"'))
+        lines.append('# TYPE qr_encode_batch_size histogram')
+        lines.extend(self.batch_size.expose('qr_encode_batch_size'))
+        lines.append('# TYPE qr_rejected_total counter')
+        lines.append(f'qr_rejected_total {self.rejected}')
+        lines.append('# TYPE qr_in_flight gauge')
+        lines.append(f'qr_in_flight {self.in_flight}')
+        return ('\n'.join(lines) + '\n').encode()
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class EncodeBatcher:
+    """
+    Collects encode jobs and sends them to the pool in batches: whatever is queued
+    when a batch starts (up to max_batch), plus what arrives within max_delay.
+    """
+
+    def __init__(self, pool, metrics, max_batch=64, max_delay=0.002):
+        self.pool = pool
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue()
+        self._tasks = set()
+
+    async def submit(self, job):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((job, future))
+        return await future
+
+    def _drain(self, batch):
+        while len(batch) < self.max_batch and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            self._drain(batch)
+            if len(batch) < self.max_batch and self.max_delay:
+                await asyncio.sleep(self.max_delay)
+                self._drain(batch)
+            task = asyncio.create_task(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch):
+        self.metrics.batch_size.observe(len(batch))
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.pool, encode_batch, [job for job, _ in batch])
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class QRServer:
+    """
+    Args:
+        workers: pool processes (default: all CPUs); 0 runs the work in one thread
+            of this process instead, which is handy for tests and debugging
+        max_in_flight: requests accepted at once before answering 503
+        max_body: largest accepted request body in bytes
+        keep_alive_timeout: seconds an idle connection is kept open
+        cache_dir: on-disk tier shared by the workers' caches
+    """
+
+    def __init__(self, host='127.0.0.1', port=8080, workers=None, max_batch=64, batch_delay=0.002,
+                 max_in_flight=256, max_body=16 << 20, keep_alive_timeout=15.0, cache_dir=None):
+        self.host = host
+        self.port = port
+        self.workers = os.cpu_count() if workers is None else workers
+        self.max_batch = max_batch
+        self.batch_delay = batch_delay
+        self.max_in_flight = max_in_flight
+        self.max_body = max_body
+        self.keep_alive_timeout = keep_alive_timeout
+        self.cache_dir = cache_dir
+        self.metrics = Metrics()
+        self.pool = None
+        self.server = None
+        self._batch_task = None
+        self._connections = {}
+
+    async def start(self):
+        if self.workers:
+            self.pool = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(self.cache_dir,))
+        else:
+            self.pool = ThreadPoolExecutor(1, initializer=init_worker, initargs=(self.cache_dir,))
+        self.batcher = EncodeBatcher(self.pool, self.metrics, self.max_batch, self.batch_delay)
+        self._batch_task = asyncio.create_task(self.batcher.run())
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        # with port=0 the system picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        # idle keep-alive connections would otherwise hold their handlers open
+        for writer in list(self._connections):
+            writer.close()
+        await asyncio.gather(*self._connections.values(), return_exceptions=True)
+        await self.server.wait_closed()
+        self._batch_task.cancel()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Serving on http://{self.host}:{self.port}", flush=True)
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    # -- request handling ---------------------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.keep_alive_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 431, TEXT, b'Headers too large.', False)
+                    break
+                keep_alive = await self._handle_request(head, reader, writer)
+                if not keep_alive:
+                    break
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _handle_request(self, head, reader, writer):
+        start = time.perf_counter()
+        endpoint = 'invalid'
+        # until the headers are parsed, an error answer closes the connection
+        keep_alive = False
+        try:
+            request_line, *header_lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+            try:
+                method, target, version = request_line.split(' ')
+            except ValueError:
+                raise HTTPError(400, 'Malformed request line.') from None
+            headers = {}
+            for line in header_lines:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            connection = headers.get('connection', '').lower()
+            keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+            if 'transfer-encoding' in headers:
+                keep_alive = False
+                raise HTTPError(501, 'Chunked request bodies are not supported; send Content-Length.')
+            # only plain decimal digits: int() would also take a sign, spaces or underscores
+            length = headers.get('content-length', '0')
+            if not (length.isascii() and length.isdigit()):
+                keep_alive = False
+                raise HTTPError(400, 'Invalid Content-Length.')
+            length = int(length)
+            if length > self.max_body:
+                keep_alive = False
+                raise HTTPError(413, f'Request bodies are limited to {self.max_body} bytes.')
+            body = await reader.readexactly(length)
+
+            url = urlsplit(target)
+            endpoint = url.path
+            status, content_type, payload = await self._route(method, url.path, parse_qs(url.query), body)
+        except HTTPError as error:
+            status, content_type, payload = error.status, TEXT, str(error).encode()
+        except asyncio.IncompleteReadError:
+            return False
+        except Exception as error:
+            status, content_type, payload = 500, TEXT, f'{type(error).__name__}: {error}'.encode()
+            keep_alive = False
+
+        if endpoint not in ('/encode', '/decode', '/metrics', '/health'):
+            endpoint = 'other'
+        self.metrics.record(endpoint, status, time.perf_counter() - start)
+        extra = {'Retry-After': '1'} if status == 503 else {}
+        await self._respond(writer, status, content_type, payload, keep_alive, extra)
+        return keep_alive
+
+    async def _respond(self, writer, status, content_type, body, keep_alive, extra=None):
+        headers = [f'HTTP/1.1 {status} {REASONS.get(status, "")}',
+                   f'Content-Type: {content_type}',
+                   f'Content-Length: {len(body)}',
+                   'Connection: ' + ('keep-alive' if keep_alive else 'close')]
+        if keep_alive:
+            headers.append(f'Keep-Alive: timeout={int(self.keep_alive_timeout)}')
+        headers.extend(f'{name}: {value}' for name, value in (extra or {}).items())
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def _route(self, method, path, query, body):
+        if path == '/health':
+            return 200, TEXT, b'ok\n'
+        if path == '/metrics':
+            return 200, 'text/plain; version=0.0.4', self.metrics.expose()
+        if path == '/encode':
+            if method not in ('GET', 'POST'):
+                raise HTTPError(405, 'Use GET or POST.')
+            job = self._encode_job(method, query, body)
+            return await self._limited(lambda: self.batcher.submit(job))
+        if path == '/decode':
+            if method != 'POST':
+                raise HTTPError(405, 'POST the image file.')
+            binarizer = query.get('binarizer', ['global'])[0].lower()
+            if binarizer not in qr_reader.BINARIZERS:
+                raise HTTPError(400, f'binarizer must be one of {", ".join(qr_reader.BINARIZERS)}.')
+            loop = asyncio.get_running_loop()
+            return await self._limited(lambda: loop.run_in_executor(self.pool, decode_image, body, binarizer))
+        raise HTTPError(404, f'No such endpoint: {path}')
+
+    async def _limited(self, start_work):
+        """Starts and awaits work unless max_in_flight requests are already being processed."""
+        if self.metrics.in_flight >= self.max_in_flight:
+            self.metrics.rejected += 1
+            raise HTTPError(503, 'Too many requests in flight, retry later.')
+        self.metrics.in_flight += 1
+        try:
+            return await start_work()
+        finally:
+            self.metrics.in_flight -= 1
+
+    @staticmethod
+    def _encode_job(method, query, body):
+        def parameter(name, default):
+            return query.get(name, [default])[0]
+
+        if method == 'POST':
+            try:
+                payload = body.decode('utf-8')
+            except UnicodeDecodeError:
+                raise HTTPError(400, 'The payload must be UTF-8.') from None
+        else:
+            payload = parameter('data', None)
+            if payload is None:
+                raise HTTPError(400, 'Missing data parameter.')
+        ecl = parameter('ecl', 'L').upper()
+        if ecl not in ('L', 'M', 'Q', 'H'):
+            raise HTTPError(400, 'ecl must be one of L, M, Q, H.')
+        fmt = parameter('format', 'png').lower()
+        if fmt not in CONTENT_TYPES:
+            raise HTTPError(400, f'format must be one of {", ".join(CONTENT_TYPES)}.')
+        try:
+            scale = int(parameter('scale', '8'))
+            border = int(parameter('border', '4'))
+        except ValueError:
+            raise HTTPError(400, 'scale and border must be integers.') from None
+        if not (1 <= scale <= 100 and 0 <= border <= 64):
+            raise HTTPError(400, 'scale must be in 1..100 and border in 0..64.')
+        return payload, ecl, fmt, scale, border
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QR code encode/decode HTTP service.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None, help="pool processes (default: all CPUs, 0: in-process)")
+    parser.add_argument('--max-batch', type=int, default=64, help="encode jobs per pool task")
+    parser.add_argument('--batch-delay', type=float, default=0.002, help="seconds to wait for a batch to fill")
+    parser.add_argument('--max-in-flight', type=int, default=256, help="requests processed at once before 503")
+    parser.add_argument('--max-body', type=int, default=16 << 20, help="largest request body in bytes")
+    parser.add_argument('--keep-alive', type=float, default=15.0, help="idle connection timeout in seconds")
+    parser.add_argument('--cache-dir', default=None, help="directory for the on-disk cache tier")
+    args = parser.parse_args(argv)
+
+    server = QRServer(args.host, args.port, args.workers, args.max_batch, args.batch_delay,
+                      args.max_in_flight, args.max_body, args.keep_alive, args.cache_dir)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,10 @@
 from main import *
 import reed_solomon as rs
-import version_check as vc
+import render
 
 ECL = "L"
 input_text = "ANA ARE MERE mercedes bmv pere audi porsche lamborghini"
-ver,size = vc.version_check(input_text,ECL)
-msg = rs.final_codewords(input_text,ECL)
+ver, msg = rs.block_codewords(input_text,ECL)
 
 print(msg)
 
@@ -18,19 +17,8 @@ for linie in poza:
 
 
 # DE AICI ESTE DOAR AFISAREA MATRICEI IN POZA
-color_map = {
-    0: (255, 255, 255),  # White
-    1: (0, 0, 0),  # Black
-    8: (128, 128, 128)  # Gray
-}
-image = Image.new("RGB", (len(poza), len(poza)))
-pixels = image.load()
-for i in range(len(poza)):
-    for j in range(len(poza)):
-        pixels[j, i] = color_map[poza[i][j]]
+# imagine de 1 bit, 50 de pixeli pe modul si zona libera de 4 module
 scaling_factor = 50
-new_size = (len(poza) * scaling_factor, len(poza) * scaling_factor)
-upscaled_image = image.resize(new_size, Image.NEAREST)
+upscaled_image = render.to_image(poza, scaling_factor, border=4)
 upscaled_image.save("test.png")
 upscaled_image.show()
-
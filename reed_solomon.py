@@ -1,6 +1,7 @@
 import concatenate as ct
-import version_check as vc
+import encoding_plan as ep
 import sys
+import numpy as np
 
 """
 Reed-Solomon Encoder for a QR Code (Single Block)
@@ -113,6 +114,137 @@ def rs_encode_msg(msg_in, nsym, exp_table, log_table):
     ecc = msg_out[len(msg_in):]
     return ecc
 
+# -------------------------------------------------------------------
+# Table-driven encoder
+# -------------------------------------------------------------------
+
+# GF(256) tables for the QR primitive polynomial, built once at import.
+EXP_TABLE, LOG_TABLE = init_tables()
+
+# nsym -> generator polynomial in log domain (without the leading 1)
+_GENERATOR_LOGS = {}
+# nsym -> 256 remainders: row c is gen * c packed into one integer, highest term first
+_GENERATOR_ROWS = {}
+
+def generator_log(nsym):
+    """
+    Returns the log-domain coefficients of the generator polynomial for nsym ECC
+    codewords, highest order first and without the (monic) leading term.
+    """
+    gen = _GENERATOR_LOGS.get(nsym)
+    if gen is None:
+        gen = [LOG_TABLE[c] for c in rs_generator_poly(nsym, EXP_TABLE, LOG_TABLE)[1:]]
+        gen = _GENERATOR_LOGS.setdefault(nsym, gen)
+    return gen
+
+def generator_rows(nsym):
+    """
+    Returns a 256-entry table where entry c is the generator multiplied by c,
+    packed big-endian into a single integer of nsym bytes.
+    """
+    rows = _GENERATOR_ROWS.get(nsym)
+    if rows is None:
+        gen = generator_log(nsym)
+        rows = [0] + [int.from_bytes(bytes(EXP_TABLE[LOG_TABLE[c] + g] for g in gen), 'big')
+                      for c in range(1, 256)]
+        rows = _GENERATOR_ROWS.setdefault(nsym, rows)
+    return rows
+
+def rs_encode_block(msg_in, nsym):
+    """
+    Computes the nsym ECC codewords of one block with a table-driven LFSR.
+
+    The remainder register is kept as one integer, so every data codeword costs a
+    single table lookup and XOR instead of nsym GF multiplications.
+
+    Args:
+        msg_in: data codewords (bytes or list of integers)
+        nsym: number of ECC codewords to generate
+
+    Returns:
+        bytes of length nsym.
+    """
+    rows = generator_rows(nsym)
+    shift = 8 * (nsym - 1)
+    mask = (1 << (8 * nsym)) - 1
+    rem = 0
+    for byte in msg_in:
+        rem = ((rem << 8) & mask) ^ rows[(rem >> shift) ^ byte]
+    return rem.to_bytes(nsym, 'big')
+
+# -------------------------------------------------------------------
+# Batched encoder (NumPy)
+# -------------------------------------------------------------------
+
+# MUL_TABLE[a, b] = a * b in GF(256)
+_exp = np.array(EXP_TABLE, dtype=np.uint8)
+_log = np.array(LOG_TABLE, dtype=np.intp)
+MUL_TABLE = _exp[_log[:, None] + _log[None, :]]
+MUL_TABLE[0, :] = MUL_TABLE[:, 0] = 0
+
+# nsym -> (256, nsym) array: row c is the generator (without its leading 1) times c
+_GENERATOR_PRODUCTS = {}
+
+def generator_products(nsym):
+    products = _GENERATOR_PRODUCTS.get(nsym)
+    if products is None:
+        gen = rs_generator_poly(nsym, EXP_TABLE, LOG_TABLE)[1:]
+        products = MUL_TABLE[:, gen]
+        products.flags.writeable = False
+        products = _GENERATOR_PRODUCTS.setdefault(nsym, products)
+    return products
+
+def rs_encode_batch(blocks, nsym):
+    """
+    Computes the ECC codewords of many same-length blocks at once.
+
+    Args:
+        blocks: 2-D array (n_blocks, block_length) of data codewords; the rows can
+            come from different symbols or payloads.
+        nsym: number of ECC codewords per block
+
+    Returns:
+        uint8 array of shape (n_blocks, nsym).
+    """
+    blocks = np.asarray(blocks, dtype=np.uint8)
+    n_blocks, length = blocks.shape
+    products = generator_products(nsym)
+    # Synthetic division on all rows in parallel: column i picks one table row per block.
+    work = np.zeros((n_blocks, length + nsym), dtype=np.uint8)
+    work[:, :length] = blocks
+    for i in range(length):
+        work[:, i + 1:i + 1 + nsym] ^= products[work[:, i]]
+    return work[:, length:]
+
+def rs_encode_symbols(data_codewords, version, ecl):
+    """
+    Encodes the data codewords of one or many symbols of the same version and ECL.
+
+    Args:
+        data_codewords: array (n_symbols, data_length) or a single sequence of
+            data codewords.
+        version, ecl: symbol version and error correction level
+
+    Returns:
+        uint8 array (n_symbols, total_codewords): every symbol's data blocks
+        followed by its ECC blocks, in block order.
+    """
+    if isinstance(data_codewords, (bytes, bytearray)):
+        data_codewords = np.frombuffer(data_codewords, dtype=np.uint8)
+    data = np.atleast_2d(np.asarray(data_codewords, dtype=np.uint8))
+    block_structure = get_block_structure(version, ecl)
+    nsym = get_ecc(version, ecl) // len(block_structure)
+    n_symbols = len(data)
+
+    parts = [data]
+    start = 0
+    for size in dict.fromkeys(block_structure):
+        count = block_structure.count(size)
+        group = data[:, start:start + size * count].reshape(n_symbols * count, size)
+        parts.append(rs_encode_batch(group, nsym).reshape(n_symbols, count * nsym))
+        start += size * count
+    return np.concatenate(parts, axis=1)
+
 # -------------------------------------------------------------------
 # QR Code Block Structure and ECC Configuration
 # -------------------------------------------------------------------
@@ -276,35 +408,273 @@ def interleave_blocks(blocks):
     return interleaved
 
 # -------------------------------------------------------------------
-# Main: Demonstration using your QR code parameters
+# Reed-Solomon decoding (reader side)
 # -------------------------------------------------------------------
 
-def final_codewords(input_text,ecl):
-    # Initialize GF(256) tables.
-    exp_table, log_table = init_tables()
+def gf_pow(x, power):
+    return EXP_TABLE[(LOG_TABLE[x] * power) % 255]
 
-    # Data codewords for block 0 (provided in your model)
-    # (Note: They are given in hexadecimal.)
-    data_codewords = ct.concatenate(input_text,ecl)
+def gf_inverse(x):
+    return EXP_TABLE[255 - LOG_TABLE[x]]
 
+def gf_poly_scale(p, x):
+    return [gf_mul(c, x, EXP_TABLE, LOG_TABLE) for c in p]
 
-    version,total_codewords = vc.version_check(input_text,ecl)
+def gf_poly_add(p, q):
+    """Adds two polynomials (highest order first), aligning them on the lowest term."""
+    result = [0] * max(len(p), len(q))
+    for i, c in enumerate(p):
+        result[i + len(result) - len(p)] = c
+    for i, c in enumerate(q):
+        result[i + len(result) - len(q)] ^= c
+    return result
 
-    block_structure = get_block_structure(version, ecl)
-    blocks = split_into_blocks(data_codewords, block_structure)
+def gf_poly_eval(poly, x):
+    """Evaluates a polynomial (highest order first) at x with Horner's scheme."""
+    y = poly[0]
+    for c in poly[1:]:
+        y = gf_mul(y, x, EXP_TABLE, LOG_TABLE) ^ c
+    return y
+
+# (block_length, nsym) -> (block_length, nsym) array with alpha^(j * (n - 1 - i))
+_SYNDROME_POWERS = {}
+
+def syndrome_powers(length, nsym):
+    powers = _SYNDROME_POWERS.get((length, nsym))
+    if powers is None:
+        exponents = np.arange(length - 1, -1, -1)[:, None] * np.arange(nsym)[None, :]
+        powers = _exp[exponents % 255]
+        powers.flags.writeable = False
+        powers = _SYNDROME_POWERS.setdefault((length, nsym), powers)
+    return powers
+
+def rs_syndromes_batch(blocks, nsym):
+    """
+    Computes the syndromes S_j = c(alpha^j), j < nsym, of many same-length blocks.
 
-    # Calculate ECC per block
-    total_ecc = get_ecc(version, ecl)
-    ecc_per_block = total_ecc // len(blocks)
-    ecc_blocks = [rs_encode_msg(block, ecc_per_block, exp_table, log_table) for block in blocks]
+    Args:
+        blocks: 2-D array (n_blocks, block_length) of data + ECC codewords
+
+    Returns:
+        uint8 array (n_blocks, nsym); a block is clean when its row is all zeros.
+    """
+    blocks = np.asarray(blocks, dtype=np.uint8)
+    terms = MUL_TABLE[blocks[:, :, None], syndrome_powers(blocks.shape[1], nsym)[None, :, :]]
+    return np.bitwise_xor.reduce(terms, axis=1)
+
+def rs_find_error_locator(synd, nsym):
+    """
+    Berlekamp-Massey: finds the error locator polynomial from the syndromes.
+    synd starts with a padding 0, followed by the nsym syndromes.
+    """
+    err_loc = [1]
+    old_loc = [1]
+    for i in range(nsym):
+        k = i + 1
+        delta = synd[k]
+        for j in range(1, len(err_loc)):
+            delta ^= gf_mul(err_loc[-(j + 1)], synd[k - j], EXP_TABLE, LOG_TABLE)
+        old_loc = old_loc + [0]
+        if delta != 0:
+            if len(old_loc) > len(err_loc):
+                new_loc = gf_poly_scale(old_loc, delta)
+                old_loc = gf_poly_scale(err_loc, gf_inverse(delta))
+                err_loc = new_loc
+            err_loc = gf_poly_add(err_loc, gf_poly_scale(old_loc, delta))
+    while err_loc and err_loc[0] == 0:
+        del err_loc[0]
+    if (len(err_loc) - 1) * 2 > nsym:
+        raise ValueError("Too many errors to correct.")
+    return err_loc
+
+def rs_find_errors(err_loc, nmess):
+    """
+    Chien search: returns the positions (indices in the message) of the errors.
+    err_loc is given lowest order first.
+    """
+    err_pos = [nmess - 1 - i for i in range(nmess) if gf_poly_eval(err_loc, gf_pow(2, i)) == 0]
+    if len(err_pos) != len(err_loc) - 1:
+        raise ValueError("Could not locate the errors.")
+    return err_pos
+
+def rs_correct_errata(msg, synd, err_pos):
+    """
+    Forney: computes the error magnitudes and returns the corrected message.
+    """
+    coef_pos = [len(msg) - 1 - p for p in err_pos]
+    err_loc = [1]
+    for i in coef_pos:
+        err_loc = gf_poly_mul(err_loc, [gf_pow(2, i), 1], EXP_TABLE, LOG_TABLE)
+    # error evaluator: (S(x) * err_loc(x)) mod x^(errors + 1), lowest order first
+    nerr = len(err_loc) - 1
+    product = gf_poly_mul(synd[::-1], err_loc, EXP_TABLE, LOG_TABLE)
+    err_eval = product[len(product) - (nerr + 1):][::-1]
+
+    X = [gf_pow(2, p) for p in coef_pos]
+    errors = [0] * len(msg)
+    for i, Xi in enumerate(X):
+        Xi_inv = gf_inverse(Xi)
+        err_loc_prime = 1
+        for j, Xj in enumerate(X):
+            if j != i:
+                err_loc_prime = gf_mul(err_loc_prime, 1 ^ gf_mul(Xi_inv, Xj, EXP_TABLE, LOG_TABLE),
+                                       EXP_TABLE, LOG_TABLE)
+        if err_loc_prime == 0:
+            raise ValueError("Could not correct the errors.")
+        y = gf_mul(Xi, gf_poly_eval(err_eval[::-1], Xi_inv), EXP_TABLE, LOG_TABLE)
+        errors[err_pos[i]] = gf_mul(y, gf_inverse(err_loc_prime), EXP_TABLE, LOG_TABLE)
+    return gf_poly_add(msg, errors)
+
+def rs_correct_msg(msg_in, nsym, synd=None):
+    """
+    Corrects one block (data + ECC codewords).
+
+    Args:
+        msg_in: list of codewords of the block
+        nsym: number of ECC codewords in the block
+        synd: the block's nsym syndromes, if already computed
+
+    Returns:
+        (corrected codewords, number of corrected errors)
+
+    Raises:
+        ValueError: if the block has more errors than the code can correct.
+    """
+    msg = list(msg_in)
+    if synd is None:
+        synd = rs_syndromes_batch([msg], nsym)[0]
+    synd = [0] + [int(s) for s in synd]
+    if not any(synd):
+        return msg, 0
+    err_loc = rs_find_error_locator(synd, nsym)
+    err_pos = rs_find_errors(err_loc[::-1], len(msg))
+    msg = rs_correct_errata(msg, synd, err_pos)
+    if rs_syndromes_batch([msg], nsym).any():
+        raise ValueError("Could not correct the message.")
+    return msg, len(err_pos)
+
+def rs_decode_symbol(codewords, version, ecl):
+    """
+    Checks and corrects all blocks of one symbol.
+
+    Syndromes are computed for all blocks at once; when they are all zero (a
+    clean read) the data codewords are returned without further work. Only dirty
+    blocks go through Berlekamp-Massey, Chien search and Forney.
+
+    Args:
+        codewords: data blocks followed by ECC blocks, in block order
+            (the inverse of interleave_order), as bytes or a uint8 array
+        version, ecl: symbol version and error correction level
+
+    Returns:
+        (data codewords as bytes, number of corrected codewords)
 
-    # Interleave data and ECC
-    interleaved_data = interleave_blocks(blocks)
-    interleaved_ecc = interleave_blocks(ecc_blocks)
+    Raises:
+        ValueError: if a block cannot be corrected.
+    """
+    if isinstance(codewords, (bytes, bytearray, memoryview)):
+        codewords = np.frombuffer(codewords, dtype=np.uint8)
+    codewords = np.asarray(codewords, dtype=np.uint8).ravel()
+    block_structure = get_block_structure(version, ecl)
+    nsym = get_ecc(version, ecl) // len(block_structure)
+    total_data = sum(block_structure)
+    ecc = codewords[total_data:total_data + nsym * len(block_structure)].reshape(-1, nsym)
+
+    groups = []
+    start = first = 0
+    for size in dict.fromkeys(block_structure):
+        count = block_structure.count(size)
+        blocks = np.concatenate([codewords[start:start + size * count].reshape(count, size),
+                                 ecc[first:first + count]], axis=1)
+        groups.append((start, size, blocks, rs_syndromes_batch(blocks, nsym)))
+        start += size * count
+        first += count
+
+    data = codewords[:total_data]
+    if not any(synd.any() for _, _, _, synd in groups):
+        return data.tobytes(), 0
+
+    data = data.copy()
+    corrected = 0
+    for start, size, blocks, synd in groups:
+        for b in np.flatnonzero(synd.any(axis=1)):
+            msg, count = rs_correct_msg(blocks[b].tolist(), nsym, synd[b])
+            data[start + b * size:start + (b + 1) * size] = msg[:size]
+            corrected += count
+    return data.tobytes(), corrected
 
-    final = interleaved_data + interleaved_ecc
+# -------------------------------------------------------------------
+# Main: Demonstration using your QR code parameters
+# -------------------------------------------------------------------
 
-    # Print out the results in hexadecimal.
+def interleave_order(version, ecl):
+    """
+    Returns, for every position of the interleaved codeword sequence, the index of
+    that codeword in the block-order stream (all data blocks, then all ECC blocks).
+    """
+    block_structure = get_block_structure(version, ecl)
+    ecc_per_block = get_ecc(version, ecl) // len(block_structure)
+    data_offsets, ecc_offsets = [], []
+    offset = 0
+    for size in block_structure:
+        data_offsets.append(range(offset, offset + size))
+        offset += size
+    for _ in block_structure:
+        ecc_offsets.append(range(offset, offset + ecc_per_block))
+        offset += ecc_per_block
+    return interleave_blocks(data_offsets) + interleave_blocks(ecc_offsets)
+
+def block_codewords(input_text, ecl="L"):
+    """
+    Encodes input_text (or an EncodingPlan) and returns (version, codewords), where
+    codewords holds the data blocks followed by their ECC blocks, in block order
+    (not interleaved).
+    """
+    if isinstance(input_text, ep.EncodingPlan):
+        plan = input_text
+    else:
+        plan = ep.plan_encoding(input_text, ecl)
+    data_codewords = ct.concatenate(plan)[:plan.capacity]
+    return plan.version, rs_encode_symbols(data_codewords, plan.version, plan.ecl)[0].tobytes()
+
+def final_codewords(input_text,ecl="L"):
+    if not isinstance(input_text, ep.EncodingPlan):
+        input_text = ep.plan_encoding(input_text, ecl)
+    # Interleave data and ECC, in the order the modules are filled
+    version, codewords = block_codewords(input_text)
+    final = [codewords[i] for i in interleave_order(version, input_text.ecl)]
+
+    # Return the bit string of the final message.
     return "".join(f"{cw:08b}" for cw in final)
 #print(final_codewords("fututi pizda matii de rusu mancamiai toate coaiele de handicapat sa moara toata facultatea unibuc si matematica si informatoiva HWDWAHH morgt  HGDywgDYd HWGDYgd dhAGygWAUdh WD dsw <3"))
 
+
+def benchmark(seconds=0.2):
+    """
+    Microbenchmark: ECC throughput (codewords/sec) of the reference encoder
+    (rs_encode_msg) and of the table-driven one, for every version and ECL.
+    """
+    import random
+    import time
+
+    def rate(encode, blocks, nsym):
+        count, start = 0, time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            for block in blocks:
+                encode(block, nsym)
+            count += sum(len(block) + nsym for block in blocks)
+        return count / (time.perf_counter() - start)
+
+    print(f"{'ver':>3} {'ecl':>3} {'before cw/s':>12} {'after cw/s':>12} {'speedup':>8}")
+    for version in range(1, 41):
+        for ecl in 'LMQH':
+            block_structure = get_block_structure(version, ecl)
+            nsym = get_ecc(version, ecl) // len(block_structure)
+            blocks = [[random.randrange(256) for _ in range(size)] for size in block_structure]
+            before = rate(lambda b, n: rs_encode_msg(b, n, EXP_TABLE, LOG_TABLE), blocks, nsym)
+            after = rate(rs_encode_block, blocks, nsym)
+            print(f"{version:>3} {ecl:>3} {before:>12.0f} {after:>12.0f} {after / before:>7.1f}x")
+
+
+if __name__ == "__main__":
+    benchmark(float(sys.argv[1]) if len(sys.argv) > 1 else 0.2)
@@ -0,0 +1,229 @@
+"""
+Rasterizer: module matrix -> pixels, without going through RGB.
+
+Every module becomes a scale x scale block and a light quiet zone of `border`
+modules goes around the symbol. Only one pixel row per module row is expanded;
+it is then broadcast into the scale rows of the output it covers, so no
+per-pixel Python loop runs and nothing larger than one row band is allocated
+besides the output. 1-bit output can be produced directly as packed rows
+(8 pixels per byte); PBM/PGM files are written without PIL, which is only
+needed for to_image.
+"""
+import numpy as np
+
+DARK, LIGHT = 0, 255
+
+
+def image_size(size, scale=1, border=4):
+    """Side in pixels of the image of a size x size matrix."""
+    return (size + 2 * border) * scale
+
+
+def _modules(matrix):
+    matrix = np.asarray(matrix)
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError(f"Expected a square module matrix, got shape {matrix.shape}.")
+    return matrix != 0
+
+
+def _check_out(out, shape, dtype):
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != shape or out.dtype != dtype:
+        raise ValueError(f"Output buffer must have shape {shape} and dtype {np.dtype(dtype)}, "
+                         f"got {out.shape} and {out.dtype}.")
+    return out
+
+
+def render(matrix, scale=1, border=4, mode='L', out=None):
+    """
+    Renders a module matrix as pixels.
+
+    Args:
+        matrix: square matrix (array or nested list), nonzero = dark module
+        scale: pixels per module
+        border: quiet zone in modules
+        mode: 'L' for uint8 pixels (0 dark, 255 light) or '1' for bool pixels
+            (True light, as in PIL mode '1')
+        out: optional array of the right shape and dtype to render into
+
+    Returns:
+        the (side, side) pixel array (out, if given).
+
+    Raises:
+        ValueError: for a bad mode, matrix or output buffer.
+    """
+    if mode == 'L':
+        dtype, dark, light = np.uint8, DARK, LIGHT
+    elif mode == '1':
+        dtype, dark, light = np.bool_, False, True
+    else:
+        raise ValueError(f"Unsupported mode {mode!r}: use 'L' or '1'.")
+    modules = _modules(matrix)
+    side = image_size(len(modules), scale, border)
+    out = _check_out(out, (side, side), dtype)
+
+    # one pixel row per module row, then scale copies of each of them
+    rows = np.where(np.pad(modules, border), dark, light).astype(dtype, copy=False).repeat(scale, axis=1)
+    out.reshape(-1, scale, side)[:] = rows[:, None, :]
+    return out
+
+
+def render_packed(matrix, scale=1, border=4, dark_bit=1, out=None):
+    """
+    Renders a module matrix as packed 1-bit rows, 8 pixels per byte, most
+    significant bit first and every row padded to a whole byte.
+
+    Only one pixel row per module row is expanded and packed; the scale copies of
+    it are byte copies, so the work and memory are those of the 1-bit output.
+
+    Args:
+        dark_bit: bit value of a dark pixel (1 for PBM, 0 for PIL mode '1')
+        out: optional uint8 array (side, ceil(side / 8)) to render into
+
+    Returns:
+        the (side, ceil(side / 8)) uint8 array (out, if given).
+    """
+    modules = _modules(matrix)
+    if not dark_bit:
+        modules = ~modules
+    side = image_size(len(modules), scale, border)
+    out = _check_out(out, (side, (side + 7) // 8), np.uint8)
+
+    rows = np.pad(modules, border, constant_values=not dark_bit).repeat(scale, axis=1)
+    packed = np.packbits(rows, axis=1)
+    out.reshape(-1, scale, out.shape[1])[:] = packed[:, None, :]
+    return out
+
+
+def to_image(matrix, scale=1, border=4, mode='1'):
+    """Renders a module matrix as a PIL image in mode '1' or 'L'."""
+    from PIL import Image
+    side = image_size(len(matrix), scale, border)
+    if mode == '1':
+        return Image.frombytes('1', (side, side), render_packed(matrix, scale, border, dark_bit=0).tobytes())
+    return Image.fromarray(render(matrix, scale, border, mode))
+
+
+def write_png(file, matrix, scale=1, border=4):
+    """Writes a 1-bit PNG image of the matrix to a binary file object (needs PIL)."""
+    to_image(matrix, scale, border).save(file, format='PNG')
+
+
+def write_pbm(file, matrix, scale=1, border=4):
+    """Writes a binary PBM (P4) image of the matrix to a binary file object."""
+    side = image_size(len(matrix), scale, border)
+    file.write(b'P4\n%d %d\n' % (side, side))
+    file.write(render_packed(matrix, scale, border).tobytes())
+
+
+def write_pgm(file, matrix, scale=1, border=4):
+    """Writes a binary PGM (P5) image of the matrix to a binary file object."""
+    side = image_size(len(matrix), scale, border)
+    file.write(b'P5\n%d %d\n255\n' % (side, side))
+    file.write(render(matrix, scale, border).tobytes())
+
+
+# ---------------------------------------------------------------------------
+# Vector output
+# ---------------------------------------------------------------------------
+
+def runs(matrix):
+    """
+    Horizontal runs of dark modules.
+
+    Returns:
+        (rows, starts, lengths): int arrays, one entry per run, in row-major order.
+    """
+    modules = _modules(matrix).view(np.int8)
+    edges = np.diff(np.pad(modules, ((0, 0), (1, 1))), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    return rows, starts, stops - starts
+
+
+def rectangles(matrix):
+    """
+    Dark modules merged into rectangles: horizontal runs first, then runs with the
+    same start and length on consecutive rows are stacked into one rectangle.
+
+    Returns:
+        list of (x, y, width, height) in modules, ordered by their top row.
+    """
+    merged = []
+    # (start, length) -> index in merged of the rectangle that ended on the previous row
+    open_runs = {}
+    previous_row = None
+    for row, start, length in zip(*(array.tolist() for array in runs(matrix))):
+        if row != previous_row:
+            if previous_row != row - 1:
+                open_runs = {}
+            ended, open_runs, previous_row = open_runs, {}, row
+        index = ended.get((start, length))
+        if index is None:
+            index = len(merged)
+            merged.append([start, row, length, 1])
+        else:
+            merged[index][3] += 1
+        open_runs[(start, length)] = index
+    return [tuple(rect) for rect in merged]
+
+
+def _chunked(items, size=1024):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def write_svg(file, matrix, scale=1, border=4, dark='#000', light='#fff'):
+    """
+    Writes an SVG image of the matrix to a binary file object as one path of
+    merged rectangles. Coordinates are in modules; scale sets the width and height
+    attributes in pixels. light=None leaves the background transparent.
+    """
+    size = len(_modules(matrix))
+    side = size + 2 * border
+    file.write(b'<?xml version="1.0" encoding="UTF-8"?>\n'
+               b'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="%d" height="%d" '
+               b'viewBox="0 0 %d %d" shape-rendering="crispEdges">\n' % (side * scale, side * scale, side, side))
+    if light is not None:
+        file.write(f'<rect width="{side}" height="{side}" fill="{light}"/>\n'.encode())
+    file.write(f'<path fill="{dark}" d="M{border} {border}'.encode())
+    # after z the pen is back at the corner of the last rectangle, so relative moves keep the numbers short
+    x0 = y0 = 0
+    for chunk in _chunked(rectangles(matrix)):
+        commands = []
+        for x, y, w, h in chunk:
+            commands.append(f"m{x - x0} {y - y0}h{w}v{h}h-{w}z")
+            x0, y0 = x, y
+        file.write(''.join(commands).encode())
+    file.write(b'"/>\n</svg>\n')
+
+
+def write_pdf(file, matrix, scale=1, border=4):
+    """
+    Writes a one-page PDF of the matrix to a binary file object, drawing the merged
+    rectangles as filled paths. scale is the module size in points.
+    """
+    size = len(_modules(matrix))
+    side = (size + 2 * border) * scale
+    # flip the y axis and work in modules, as in the SVG
+    content = [b'%d 0 0 %d 0 %d cm\n' % (scale, -scale, side)]
+    for chunk in _chunked(rectangles(matrix)):
+        content.append(''.join(f"{x + border} {y + border} {w} {h} re\n" for x, y, w, h in chunk).encode())
+    content.append(b'f\n')
+    content = b''.join(content)
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents 4 0 R /Resources << >> >>' % (side, side),
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content),
+    ]
+    offset = file.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(offset)
+        offset += file.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+    file.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    file.write(b''.join(b'%010d 00000 n \n' % position for position in offsets))
+    file.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, offset))
@@ -0,0 +1,145 @@
+"""
+Optimal mixed-mode segmentation.
+
+Instead of encoding the whole payload in the tightest single mode, a dynamic
+program over runs of same-class characters finds the sequence of numeric / alphanumeric / byte /
+Kanji segments with the fewest bits, charging every new segment its mode indicator and
+character count field for the given version.
+"""
+import numpy as np
+
+import data_segment as ds
+import unicode_analyze as ua
+
+SEGMENT_MODES = ('numeric', 'alphanumeric', 'byte', 'kanji')
+
+# Costs are counted in sixths of a bit, so that a numeric digit (10 bits per 3)
+# and an alphanumeric character (11 bits per 2) cost a whole number.
+NUMERIC_COST = 20
+ALPHANUMERIC_COST = 33
+BYTE_COST = 48
+KANJI_COST = 78
+
+
+# Per character class: cost in numeric, alphanumeric and Kanji mode (None if the
+# mode cannot encode it); the byte cost depends on the UTF-8 length.
+CLASS_COSTS = {
+    ua.NUMERIC: (NUMERIC_COST, ALPHANUMERIC_COST, None),
+    ua.ALPHANUMERIC: (None, ALPHANUMERIC_COST, None),
+    ua.BYTE: (None, None, None),
+    ua.KANJI: (None, None, KANJI_COST),
+}
+
+
+# Within a run of characters of one class every mode costs the same per character, so
+# the cost of leaving a mode after p characters of the run changes linearly in steps of
+# 6 characters (the 6 sixths of the rounding). The best place to switch is thus within
+# RUN_EDGE characters of either end: only those are stepped one by one, the middle of a
+# long run is one step.
+RUN_EDGE = 5
+
+# Cheapest cost of a character of each class (byte: per UTF-8 byte).
+CHEAPEST_COSTS = np.array([NUMERIC_COST, ALPHANUMERIC_COST, BYTE_COST, KANJI_COST])
+
+
+def class_runs(classes):
+    """
+    Groups the characters into runs of the same class and UTF-8 length.
+
+    Returns:
+        [(class, utf8 length, start, stop), ...]
+    """
+    char_class, utf8_lengths = classes
+    keys = char_class.astype(np.int32) * 8 + utf8_lengths
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1, [len(keys)]))
+    starts = bounds[:-1]
+    return list(zip(char_class[starts].tolist(), utf8_lengths[starts].tolist(),
+                    starts.tolist(), bounds[1:].tolist()))
+
+
+def minimum_bits(classes):
+    """
+    Lower bound on the data bits of any segmentation: every character in its
+    cheapest mode and no segment headers.
+    """
+    char_class, utf8_lengths = classes
+    costs = CHEAPEST_COSTS[char_class]
+    costs[char_class == ua.BYTE] *= utf8_lengths[char_class == ua.BYTE]
+    return (int(costs.sum()) + 5) // 6
+
+
+def _run_steps(start, stop):
+    """Splits a run into DP steps: single characters near its ends, one block between."""
+    if stop - start <= 2 * RUN_EDGE:
+        return [(i, i + 1) for i in range(start, stop)]
+    head = [(i, i + 1) for i in range(start, start + RUN_EDGE)]
+    tail = [(i, i + 1) for i in range(stop - RUN_EDGE, stop)]
+    return head + [(start + RUN_EDGE, stop - RUN_EDGE)] + tail
+
+
+def optimal_segments(input_text, version, classes=None):
+    """
+    Splits input_text into the mode segments with the fewest bits for the given version.
+
+    Args:
+        classes: the (classes, utf8_lengths) of unicode_analyze.char_classes, if
+            already computed
+
+    Returns:
+        [(mode, text), ...]
+    """
+    if not input_text:
+        return [('byte', '')]
+    if classes is None:
+        classes = ua.char_classes(input_text)
+    char_class = classes[0]
+    # one class throughout: its own mode beats any split
+    lowest, highest = char_class.min(), char_class.max()
+    if lowest == highest:
+        return [(ua.CLASS_MODES[lowest], input_text)]
+
+    n_modes = len(SEGMENT_MODES)
+    head_costs = [(4 + ds.count_bits(mode, version)) * 6 for mode in SEGMENT_MODES]
+    prev_costs = list(head_costs)
+    # steps[i]: (start, stop) of the characters of step i;
+    # step_modes[i][j]: their mode when the encoding is in mode j after them
+    steps = []
+    step_modes = []
+
+    for cls, length, run_start, run_stop in class_runs(classes):
+        numeric, alphanumeric, kanji = CLASS_COSTS[cls]
+        costs = (numeric, alphanumeric, BYTE_COST * length, kanji)
+        for step in _run_steps(run_start, run_stop):
+            count = step[1] - step[0]
+            cur_costs = [None] * n_modes
+            modes = [None] * n_modes
+            for j in range(n_modes):
+                if costs[j] is not None:
+                    cur_costs[j] = prev_costs[j] + costs[j] * count
+                    modes[j] = j
+            # start a new segment in mode j right after this step
+            for j in range(n_modes):
+                for k in range(n_modes):
+                    if k != j and cur_costs[k] is not None:
+                        switched = (cur_costs[k] + 5) // 6 * 6 + head_costs[j]
+                        if cur_costs[j] is None or switched < cur_costs[j]:
+                            cur_costs[j] = switched
+                            modes[j] = k
+            steps.append(step)
+            step_modes.append(modes)
+            prev_costs = cur_costs
+
+    # trace the cheapest path backwards and group equal modes into segments
+    mode = min(range(n_modes), key=lambda j: prev_costs[j])
+    result = [0] * len(steps)
+    for i in range(len(steps) - 1, -1, -1):
+        mode = step_modes[i][mode]
+        result[i] = mode
+
+    segments = []
+    first = 0
+    for i in range(1, len(steps) + 1):
+        if i == len(steps) or result[i] != result[first]:
+            segments.append((SEGMENT_MODES[result[first]], input_text[steps[first][0]:steps[i - 1][1]]))
+            first = i
+    return segments
@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+
+from qr_server import QRServer
+
+
+class QRServerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = QRServer(port=0, workers=0)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def request(self, raw):
+        """Sends raw request bytes and returns (status, body) of the reply."""
+        reader, writer = await asyncio.open_connection(self.server.host, self.server.port)
+        writer.write(raw)
+        await writer.drain()
+        reply = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        await writer.wait_closed()
+        head, _, body = reply.partition(b'\r\n\r\n')
+        return int(head.split(b' ')[1]), body
+
+    async def test_malformed_request_line(self):
+        status, body = await self.request(b'GARBAGE\r\n\r\n')
+        self.assertEqual(status, 400)
+        self.assertEqual(body, b'Malformed request line.')
+        self.assertEqual(self.server.metrics.requests[('other', 400)], 1)
+
+    async def test_invalid_content_length(self):
+        for length in (b'-1', b'abc', b'+3'):
+            status, _ = await self.request(b'POST /encode HTTP/1.1\r\nContent-Length: ' + length + b'\r\n\r\nabc')
+            self.assertEqual(status, 400)
+
+    async def test_encode(self):
+        status, body = await self.request(b'GET /encode?data=hello&format=matrix HTTP/1.1\r\nConnection: close\r\n\r\n')
+        self.assertEqual(status, 200)
+        self.assertIn(b'"version": 1', body)
+
+    async def test_image_pixel_limit(self):
+        payload = b'x' * 2000
+        status, body = await self.request(b'POST /encode?format=pgm&scale=100&border=64 HTTP/1.1\r\n'
+                                          b'Content-Length: 2000\r\nConnection: close\r\n\r\n' + payload)
+        self.assertEqual(status, 400)
+        self.assertIn(b'over the limit', body)
+        status, _ = await self.request(b'POST /encode?format=svg&scale=100&border=64 HTTP/1.1\r\n'
+                                       b'Content-Length: 2000\r\nConnection: close\r\n\r\n' + payload)
+        self.assertEqual(status, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import random
+import unittest
+
+import reed_solomon as rs
+
+
+def block_positions(version, ecl):
+    """Positions of every block's data and ECC codewords in the block-order stream."""
+    block_structure = rs.get_block_structure(version, ecl)
+    nsym = rs.get_ecc(version, ecl) // len(block_structure)
+    ecc_start = sum(block_structure)
+    positions = []
+    data_start = 0
+    for i, size in enumerate(block_structure):
+        positions.append(list(range(data_start, data_start + size))
+                         + list(range(ecc_start + i * nsym, ecc_start + (i + 1) * nsym)))
+        data_start += size
+    return positions, nsym
+
+
+class DecodeSymbolTest(unittest.TestCase):
+
+    def test_clean_round_trip(self):
+        for ecl in 'LMQH':
+            version, codewords = rs.block_codewords("HELLO WORLD 12345", ecl)
+            data, corrected = rs.rs_decode_symbol(codewords, version, ecl)
+            self.assertEqual(corrected, 0)
+            self.assertEqual(data, codewords[:len(data)])
+
+    def test_corrects_up_to_t_errors_per_block(self):
+        rng = random.Random(8)
+        for text, ecl in (("hello", 'L'), ("x" * 120, 'M'), ("y" * 600, 'Q'), ("z" * 1200, 'H'), ("w" * 2900, 'L')):
+            version, codewords = rs.block_codewords(text, ecl)
+            positions, nsym = block_positions(version, ecl)
+            damaged = bytearray(codewords)
+            injected = 0
+            for block in positions:
+                for position in rng.sample(block, rng.randint(1, nsym // 2)):
+                    damaged[position] ^= rng.randint(1, 255)
+                    injected += 1
+            data, corrected = rs.rs_decode_symbol(bytes(damaged), version, ecl)
+            self.assertEqual(data, codewords[:len(data)])
+            self.assertEqual(corrected, injected)
+
+    def test_too_many_errors(self):
+        version, codewords = rs.block_codewords("hello", 'L')
+        positions, nsym = block_positions(version, 'L')
+        damaged = bytearray(codewords)
+        for position in positions[0][:nsym]:
+            damaged[position] ^= 0x5A
+        with self.assertRaises(ValueError):
+            rs.rs_decode_symbol(damaged, version, 'L')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,22 @@
 import sys
+import numpy as np
 
 # Define the encodable characters for each mode
 NUMERIC_CHARS = set('0123456789')
 ALPHANUMERIC_CHARS = set('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:')
 
+# Character classes: the tightest mode that can encode a character.
+# Numeric characters are also alphanumeric, and everything can go in byte mode.
+NUMERIC, ALPHANUMERIC, BYTE, KANJI = 0, 1, 2, 3
+CLASS_MODES = ('numeric', 'alphanumeric', 'byte', 'kanji')
+
+# Class of every ASCII character, looked up for a whole string at once.
+ASCII_CLASSES = np.full(128, BYTE, dtype=np.uint8)
+ASCII_CLASSES[[ord(char) for char in ALPHANUMERIC_CHARS]] = ALPHANUMERIC
+ASCII_CLASSES[[ord(char) for char in NUMERIC_CHARS]] = NUMERIC
+DIGIT_BYTES = b'0123456789'
+ALPHANUMERIC_BYTES = ''.join(sorted(ALPHANUMERIC_CHARS)).encode('ascii')
+
 def can_encode_numeric(input_text):
     return all(char in NUMERIC_CHARS for char in input_text)
 
@@ -24,12 +37,66 @@ def can_encode_kanji(input_text):
     except UnicodeEncodeError:
         return False
 
+def is_kanji(char):
+    """True if char is a double-byte Shift-JIS character that Kanji mode can encode."""
+    if char < '\x80':
+        return False
+    try:
+        encoded = char.encode('shift_jis')
+    except UnicodeEncodeError:
+        return False
+    code = int.from_bytes(encoded, 'big')
+    return len(encoded) == 2 and (0x8140 <= code <= 0x9FFC or 0xE040 <= code <= 0xEBBF)
+
+def tightest_mode(input_text):
+    """
+    Returns the tightest single mode for the whole text in one pass: 'numeric',
+    'alphanumeric', 'byte' or 'kanji'.
+    """
+    if input_text.isascii():
+        # bytes.translate deletes the allowed characters at C speed; nothing left means the mode fits
+        raw = input_text.encode('ascii')
+        if not raw.translate(None, DIGIT_BYTES):
+            return 'numeric'
+        if not raw.translate(None, ALPHANUMERIC_BYTES):
+            return 'alphanumeric'
+        return 'byte'
+    # With non-ASCII text only Kanji can still beat byte mode; the first other character decides.
+    for char in input_text:
+        if not is_kanji(char):
+            return 'byte'
+    return 'kanji'
+
+def char_classes(input_text):
+    """
+    Classifies every character of the text.
+
+    Returns:
+        (classes, utf8_lengths): uint8 arrays with the class (NUMERIC, ALPHANUMERIC,
+        BYTE or KANJI) and the UTF-8 length of each character.
+    """
+    if input_text.isascii():
+        raw = np.frombuffer(input_text.encode('ascii'), dtype=np.uint8)
+        return ASCII_CLASSES[raw], np.ones(len(raw), dtype=np.uint8)
+
+    points = np.frombuffer(input_text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+    ascii = points < 0x80
+    classes = np.full(len(points), BYTE, dtype=np.uint8)
+    classes[ascii] = ASCII_CLASSES[points[ascii]]
+    # the Shift-JIS check runs once per distinct non-ASCII character
+    others, index = np.unique(points[~ascii], return_inverse=True)
+    kanji = np.array([is_kanji(chr(point)) for point in others], dtype=bool)
+    classes[~ascii] = np.where(kanji[index], KANJI, BYTE)
+    lengths = (1 + (points >= 0x80) + (points >= 0x800) + (points >= 0x10000)).astype(np.uint8)
+    return classes, lengths
+
 def analyze_encodings(input_text):
+    mode = tightest_mode(input_text)
     modes = {
-        'Numeric': can_encode_numeric(input_text),
-        'Alphanumeric': can_encode_alphanumeric(input_text),
-        'Byte': can_encode_byte(input_text),
-        'Kanji': can_encode_kanji(input_text)
+        'Numeric': mode == 'numeric',
+        'Alphanumeric': mode in ('numeric', 'alphanumeric'),
+        'Byte': input_text.isascii() or can_encode_byte(input_text),
+        'Kanji': mode == 'kanji'
     }
     return modes
 